@@ -0,0 +1,184 @@
+""" aggregates of history and stats files, however large they are
+
+    python analyze.py 2024-01-01_12-00-00_history.csv --by gen
+    python analyze.py runs/*_history.bin runs/*_history.csv --by time --window 600
+
+The files (csv or binary, see histfile.py) are read in chunks, so the
+memory used doesn't depend on their length. Every chunk is grouped by
+generation (the Gen column) or by window of simulated time (Time // window)
+and folded into running count, mean, variance, min and max per group and
+column. Those merge exactly (Chan et al.), so every file is read by its
+own worker process and the parent only merges the small per file results.
+The table has a row per group and Mean/Std/Min/Max columns for every
+value: fitness, age, childs, food and poison eaten and every DNA gene of
+HEADER1 for history files, the running means and medians for stats files.
+"""
+import argparse
+import csv
+from multiprocessing import Pool
+from time import perf_counter
+import numpy as np
+
+import settings
+from histfile import open_history
+
+STATISTICS = ("Mean", "Std", "Min", "Max")
+
+
+class Aggregates:
+    """ count, mean, sum of squared deviations (m2), min and max of every
+    value column per group, see add() and merge() """
+
+    def __init__(self, by, window, names):
+        self.by = by  # "gen" or "time"
+        self.window = window  # seconds, by time
+        self.names = names  # value columns
+        self.groups = {}  # key: [count, mean, m2, min, max], arrays of len(names)
+        self.rows = 0
+
+    def keys(self, chunk):
+        if self.by == "gen":
+            return chunk["Gen"]
+        # Time is in simulated milliseconds
+        return chunk["Time"] // int(self.window * 1000)
+
+    def add(self, chunk):
+        """ folds a {name: array} chunk in """
+        keys = self.keys(chunk)
+        if not len(keys):
+            return
+        # rows of the same group together, one reduceat per statistic
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        values = np.column_stack([chunk[name][order] for name in self.names]).astype(float)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        counts = np.diff(np.r_[starts, len(keys)])
+        means = np.add.reduceat(values, starts, axis=0) / counts[:, None]
+        m2 = np.add.reduceat((values - np.repeat(means, counts, axis=0)) ** 2, starts, axis=0)
+        mins = np.minimum.reduceat(values, starts, axis=0)
+        maxs = np.maximum.reduceat(values, starts, axis=0)
+        for i, key in enumerate(keys[starts].tolist()):
+            self.merge_group(key, [counts[i], means[i], m2[i], mins[i], maxs[i]])
+        self.rows += len(keys)
+
+    def merge_group(self, key, other):
+        group = self.groups.get(key)
+        if group is None:
+            self.groups[key] = other
+            return
+        n_a, mean_a, m2_a, min_a, max_a = group
+        n_b, mean_b, m2_b, min_b, max_b = other
+        n = n_a + n_b
+        delta = mean_b - mean_a
+        self.groups[key] = [n, mean_a + delta * (n_b / n),
+                            m2_a + m2_b + delta ** 2 * (n_a * n_b / n),
+                            np.minimum(min_a, min_b), np.maximum(max_a, max_b)]
+
+    def merge(self, other):
+        """ adds the groups of other (of another file) """
+        if other.names != self.names:
+            raise ValueError("can't merge files with different columns")
+        for key, group in other.groups.items():
+            self.merge_group(key, group)
+        self.rows += other.rows
+
+    def table(self):
+        """ the header and a row per group, in key order """
+        key_name = "Gen" if self.by == "gen" else "Time"
+        header = [key_name, "Rows"]
+        for name in self.names:
+            header.extend(statistic + name for statistic in STATISTICS)
+        rows = []
+        for key in sorted(self.groups):
+            n, mean, m2, mins, maxs = self.groups[key]
+            # windows are named after the second they start at
+            row = [key if self.by == "gen" else key * self.window, int(n)]
+            for values in zip(mean.tolist(), np.sqrt(m2 / n).tolist(),
+                              mins.tolist(), maxs.tolist()):
+                row.extend(values)
+            rows.append(row)
+        return header, rows
+
+
+def analyze_file(task):
+    """ the Aggregates of one file """
+    path, by, window, chunk_rows = task
+    reader = open_history(path, chunk_rows)
+    key_name = "Gen" if by == "gen" else "Time"
+    if key_name not in reader.names:
+        raise ValueError(f"{path} has no {key_name} column")
+    names = tuple(name for name in reader.names if name not in ("Time", key_name))
+    aggregates = Aggregates(by, window, names)
+    for chunk in reader.chunks():
+        aggregates.add(chunk)
+    return aggregates
+
+
+def analyze(paths, by="gen", window=60, chunk_rows=65536, processes=None):
+    """ the Aggregates of all the files merged, one worker process per file """
+    tasks = [(path, by, window, chunk_rows) for path in paths]
+    if len(tasks) == 1 or processes == 1:
+        results = map(analyze_file, tasks)
+        return merge_all(results)
+    with Pool(processes) as pool:
+        # in file order, so the result doesn't depend on which worker ends first
+        return merge_all(pool.imap(analyze_file, tasks))
+
+
+def merge_all(results):
+    total = None
+    for aggregates in results:
+        if total is None:
+            total = aggregates
+        else:
+            total.merge(aggregates)
+    return total
+
+
+def save_table(header, rows, path):
+    with open(path, mode='w', newline='') as data_file:
+        data_writer = csv.writer(data_file)
+        data_writer.writerow(header)
+        data_writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Per generation or per time window aggregates of history/stats files")
+    parser.add_argument("files", nargs="+", help="csv or binary history/stats files")
+    parser.add_argument("--by", choices=["gen", "time"], default="gen",
+                        help="group by generation or by window of simulated time")
+    parser.add_argument("--window", type=float, default=60,
+                        help="simulated seconds of a time window (--by time)")
+    parser.add_argument("--chunk-rows", type=int, default=65536,
+                        help="rows read at a time from every file")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument("--out", default=None,
+                        help="results table (default: <start time>_analysis.csv)")
+    args = parser.parse_args()
+    if args.window * 1000 < 1:
+        parser.error("--window must be at least a millisecond")
+
+    start = perf_counter()
+    try:
+        aggregates = analyze(args.files, args.by, args.window, args.chunk_rows,
+                             args.processes)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    header, rows = aggregates.table()
+    elapsed = perf_counter() - start
+    if args.out is None:
+        args.out = settings.run_prefix() + "_analysis.csv"
+    save_table(header, rows, args.out)
+
+    print(f"{len(args.files)} files, {aggregates.rows} rows, {len(rows)} groups " +
+          f"in {elapsed:.2f} seconds, results in {args.out}")
+    if "Fitness" in aggregates.names and rows:
+        column = header.index("MeanFitness")
+        best = max(rows, key=lambda row: row[column])
+        print(f"Best mean fitness: {best[column]:.3f} ({header[0]} {best[0]:g})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import contextlib
+import csv
+import os
+from multiprocessing import Pool
+from time import perf_counter
+import numpy as np
+
+import settings
+from settings import HEADER1
+from config import Config, parse_assignments
+from world import World
+from vecworld import VecWorld
+
+
+def run_simulation(spec):
+    """ runs one headless world and returns a summary of its Datastats.
+    spec keys: seed, steps, seconds, generations, by_gen, numpy, overrides,
+    metrics (port of the live metrics server) """
+    config = Config(spec.get("overrides"))
+    with config.applied():
+        world_class = VecWorld if spec.get("numpy") else World
+        world = world_class(spawn_mode=spec.get("by_gen", False), save_to_csv=False,
+                            seed=spec["seed"])
+        world.ds.background_writer = False
+        if spec.get("metrics") is not None:
+            from metrics import start_metrics
+            start_metrics(world, spec["metrics"])
+
+        start = perf_counter()
+        # workers keep quiet, the console is for the parent
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            steps = world.run(steps=spec.get("steps"), seconds=spec.get("seconds"),
+                              generations=spec.get("generations"))
+            world.ds.calc_stats(world.ticks)
+        elapsed = perf_counter() - start
+        world.close()
+
+    summary = {
+        "seed": spec["seed"],
+        "spawn_mode": "By Gen" if spec.get("by_gen") else "Continuous",
+        "overrides": config.label(),
+        "steps": steps,
+        "sim_seconds": world.ticks / 1000,
+        "wall_seconds": elapsed,
+        "steps_per_second": steps / max(elapsed, 1e-9),
+        "generation": world.generation,
+        "deaths": len(world.ds.history),
+        "fitness_record": world.ds.fitness_record,
+        "record_age": world.ds.oldest_age,
+    }
+    for i, header in enumerate(HEADER1[1:]):
+        summary["Mean" + header] = world.ds.means[i]
+        summary["Median" + header] = world.ds.medians[i]
+    return summary
+
+
+def run_batch(specs, processes=None):
+    """ runs every spec in a process pool, returns the summaries sorted by seed """
+    results = []
+    with Pool(processes) as pool:
+        for summary in pool.imap_unordered(run_simulation, specs):
+            print(f"seed {summary['seed']}: {summary['steps']} steps, " +
+                  "fitness record {:.2f}, mean fitness {:.2f} ".format(
+                      summary["fitness_record"], summary["MeanFitness"]) +
+                  f"({summary['steps_per_second']:.0f} steps/s)")
+            results.append(summary)
+    results.sort(key=lambda s: s["seed"])
+    return results
+
+
+def save_results(results, path):
+    with open(path, mode='w', newline='') as data_file:
+        data_writer = csv.DictWriter(data_file, fieldnames=list(results[0].keys()))
+        data_writer.writeheader()
+        data_writer.writerows(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run many independent headless simulations in parallel")
+    parser.add_argument("--runs", type=int, default=os.cpu_count(),
+                        help="number of simulations, seeds are seed..seed+runs-1")
+    parser.add_argument("--seed", type=int, default=0, help="first seed")
+    parser.add_argument("--steps", type=int, default=None)
+    parser.add_argument("--seconds", type=float, default=None, help="simulated seconds")
+    parser.add_argument("--generations", type=int, default=None)
+    parser.add_argument("--by-gen", action="store_true", help="By Gen spawn mode")
+    parser.add_argument("--numpy", action="store_true", help="use VecWorld")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="override a value of settings.py, can be repeated")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument("--metrics", type=int, default=None, metavar="PORT",
+                        help="live metrics of the run i on port PORT + i while it runs")
+    parser.add_argument("--out", default=None,
+                        help="results table (default: <start time>_batch.csv)")
+    args = parser.parse_args()
+    if args.steps is None and args.seconds is None and args.generations is None:
+        parser.error("give a budget with --steps, --seconds and/or --generations")
+
+    overrides = parse_assignments(args.set)
+    try:
+        Config(overrides)
+    except ValueError as e:
+        parser.error(str(e))
+
+    specs = [{"seed": args.seed + i, "steps": args.steps, "seconds": args.seconds,
+              "generations": args.generations, "by_gen": args.by_gen,
+              "numpy": args.numpy, "overrides": overrides,
+              "metrics": None if args.metrics is None else args.metrics + i}
+             for i in range(args.runs)]
+    if args.out is None:
+        args.out = settings.run_prefix() + "_batch.csv"
+    start = perf_counter()
+    results = run_batch(specs, args.processes)
+    elapsed = perf_counter() - start
+    save_results(results, args.out)
+
+    fitness = [r["MeanFitness"] for r in results]
+    total_steps = sum(r["steps"] for r in results)
+    print(f"\n{len(results)} runs in {elapsed:.2f} seconds " +
+          f"({total_steps / elapsed:.0f} steps/s in total), results in {args.out}")
+    print("Mean Fitness: {:.3f} +- {:.3f}".format(np.mean(fitness), np.std(fitness)))
+    print("Fitness record: {:.3f}".format(max(r["fitness_record"] for r in results)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+""" benchmarks of the simulation hot paths at increasing scale
+
+    python bench.py                                   # writes bench.json
+    python bench.py --scales 1,10,100,1000 --out new.json --baseline bench.json
+
+Every scale multiplies the default number of creatures and foods and the
+area of the world (so the density stays the same). Results are the median
+(and min) milliseconds per call, compared against a baseline json when
+given: any case slower than baseline * (1 + threshold) is a regression and
+the exit status is 1. The startup cases time a new python importing each
+module, as the worker processes and the command line tools do.
+"""
+import os
+# no window needed, the sprites are only rendered to surfaces
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import contextlib
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from math import sqrt
+from time import perf_counter
+import numpy as np
+import pygame as pg
+
+import settings
+from config import apply_overrides
+from datastats import Datastats
+from world import World
+from vecworld import VecWorld
+from sprites import EntitySprites
+from camera import Camera
+
+BACKENDS = {"World": World, "VecWorld": VecWorld}
+CASES = ("update_creatures", "process_collisions", "valid_pos", "spawn_positions",
+         "draw_image", "draw_view", "append_to_hist", "calc_stats", "step")
+# a sample is at least this long, fast cases are called several times per sample
+MIN_SAMPLE_TIME = 0.02
+# modules whose import time (in a new interpreter, as a worker process or a
+# command line tool starts) is measured
+STARTUP_MODULES = ("settings", "world", "vecworld", "batch", "sweep", "fittest_creature")
+
+
+def timeit(func, repeat):
+    """ median and min seconds per call of func() """
+    number = 1
+    while True:
+        start = perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = perf_counter() - start
+        if elapsed >= MIN_SAMPLE_TIME or number >= 1 << 16:
+            break
+        number *= 2
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = perf_counter()
+        for _ in range(number):
+            func()
+        times.append((perf_counter() - start) / number)
+    times.sort()
+    return times[len(times) // 2], times[0], number
+
+
+def scale_settings(scale):
+    """ default counts times scale, in an area scale times bigger """
+    side = sqrt(scale)
+    return {
+        "TOTAL_CREATURES": round(settings.TOTAL_CREATURES * scale),
+        "TOTAL_FOOD": round(settings.TOTAL_FOOD * scale),
+        "TOTAL_POISON": round(settings.TOTAL_POISON * scale),
+        "WORLD_WIDTH": round(settings.WORLD_WIDTH * side),
+        "WORLD_HEIGHT": round(settings.WORLD_HEIGHT * side),
+    }
+
+
+def populate(world, creatures, foods, poison, calls=10):
+    """ fills the world up to the given counts at free positions, as the
+    spawning would do after a while, with a bounded number of calls """
+    for _ in range(calls):
+        have_foods, have_poisons = world.food_counts()
+        if have_poisons >= poison and have_foods >= foods:
+            break
+        world.spawn_foods(limit=0)
+    for _ in range(calls):
+        if len(world.all_creatures) >= creatures:
+            break
+        world.spawn_random_creatures(creatures - len(world.all_creatures))
+    # a few updates so they are moving and looking around
+    for _ in range(3):
+        world.update_creatures(settings.SIM_DT)
+
+
+def run_cases(backend, scale, cases, repeat):
+    """ times every case on a world of the given scale, returns a dict of results """
+    overrides = scale_settings(scale)
+    previous = apply_overrides(overrides)
+    results = {}
+    try:
+        world = BACKENDS[backend](save_to_csv=False, seed=0)
+        world.ds.background_writer = False
+        populate(world, overrides["TOTAL_CREATURES"], overrides["TOTAL_FOOD"],
+                 overrides["TOTAL_POISON"])
+        creatures = list(world.all_creatures)
+        positions = [(world.rng.randint(0, settings.WORLD_WIDTH),
+                      world.rng.randint(0, settings.WORLD_HEIGHT)) for _ in range(1000)]
+        sprites = EntitySprites()
+        # a window sized view at the center of the world
+        camera = Camera()
+        ds = Datastats(background_writer=False)
+        for c in creatures:
+            ds.append_to_hist(c, 0)
+
+        def valid_pos():
+            for p in positions:
+                world.valid_creature_pos(p)
+                world.valid_food_pos(p)
+
+        def draw_image():
+            for c in creatures:
+                sprites.creature(c, camera)
+
+        def append_to_hist():
+            for c in creatures:
+                ds.append_to_hist(c, 0)
+
+        funcs = {
+            "update_creatures": lambda: world.update_creatures(settings.SIM_DT),
+            "process_collisions": world.process_collisions,
+            "valid_pos": valid_pos,
+            # refill of a tenth of the foods, in the populated world
+            "spawn_positions": lambda: world.food_positions(overrides["TOTAL_FOOD"] // 10 or 1),
+            "draw_image": draw_image,
+            # images of what the camera sees, the rest is culled
+            "draw_view": lambda: sprites.blits(world, camera),
+            "append_to_hist": append_to_hist,
+            "calc_stats": lambda: ds.calc_stats(0),
+            "step": lambda: world.step(settings.SIM_DT),
+        }
+        sizes = {"creatures": len(world.all_creatures), "foods": len(world.all_foods)}
+        for case in cases:
+            # the simulation prints (mutations, stats...), keep the report clean
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                median, best, number = timeit(funcs[case], repeat)
+            results[f"{backend}/{case}/x{scale}"] = dict(
+                backend=backend, case=case, scale=scale, **sizes,
+                median_ms=median * 1000, min_ms=best * 1000, number=number, repeat=repeat)
+            print(f"{backend:9} {case:19} x{scale:<6} {sizes['creatures']:6} creatures " +
+                  f"{sizes['foods']:6} foods  {median * 1000:10.3f} ms " +
+                  f"(min {best * 1000:.3f})", flush=True)
+    finally:
+        apply_overrides(previous)
+    return results
+
+
+def run_startup(modules, repeat):
+    """ milliseconds to start python and import each module, and whether
+    that imported pygame """
+    results = {}
+    here = os.path.dirname(os.path.abspath(__file__))
+    for module in modules:
+        code = f"import sys, {module}; print('pygame' in sys.modules)"
+        times = []
+        for _ in range(repeat):
+            start = perf_counter()
+            out = subprocess.run([sys.executable, "-c", code], cwd=here, check=True,
+                                 capture_output=True, text=True).stdout
+            times.append(perf_counter() - start)
+        times.sort()
+        pygame_loaded = out.split()[-1] == "True"
+        results[f"startup/{module}"] = dict(
+            case="startup", module=module, pygame=pygame_loaded,
+            median_ms=times[len(times) // 2] * 1000, min_ms=times[0] * 1000, repeat=repeat)
+        print(f"startup   import {module:16} {times[len(times) // 2] * 1000:10.3f} ms " +
+              f"(min {times[0] * 1000:.3f}){'  pygame' if pygame_loaded else ''}", flush=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """ prints the ratios against the baseline, returns the regressions """
+    regressions = []
+    print(f"\n{'case':42} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for key, result in results.items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        ratio = result["median_ms"] / max(base["median_ms"], 1e-9)
+        status = ""
+        if ratio > 1 + threshold:
+            status = "REGRESSION"
+            regressions.append(key)
+        elif ratio < 1 - threshold:
+            status = "faster"
+        print(f"{key:42} {base['median_ms']:10.3f} {result['median_ms']:10.3f} " +
+              f"{ratio:7.2f} {status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the simulation hot paths at increasing scale")
+    parser.add_argument("--scales", default="1,10,100",
+                        help="comma separated multipliers of the default counts")
+    parser.add_argument("--backends", default=",".join(BACKENDS),
+                        help="comma separated: " + ", ".join(BACKENDS))
+    parser.add_argument("--cases", default=",".join(CASES),
+                        help="comma separated: " + ", ".join(CASES))
+    parser.add_argument("--repeat", type=int, default=5, help="samples per case")
+    parser.add_argument("--startup", default=",".join(STARTUP_MODULES),
+                        help="comma separated modules to time the import of " +
+                        "(empty: none)")
+    parser.add_argument("--out", default="bench.json", help="results json")
+    parser.add_argument("--baseline", default=None, help="results json to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown against the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    scales = [float(s) if "." in s else int(s) for s in args.scales.split(",")]
+    backends = args.backends.split(",")
+    cases = args.cases.split(",")
+    unknown = [b for b in backends if b not in BACKENDS] + [c for c in cases if c not in CASES]
+    if unknown:
+        parser.error(f"unknown backends/cases: {', '.join(unknown)}")
+
+    results = {}
+    startup = [m for m in args.startup.split(",") if m]
+    if startup:
+        results.update(run_startup(startup, args.repeat))
+    for scale in scales:
+        for backend in backends:
+            results.update(run_cases(backend, scale, cases, args.repeat))
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pygame": pg.version.ver,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"\nResults in {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions over {args.threshold:.0%}")
+            sys.exit(1)
+        print("\nno regressions")
+
+
+if __name__ == "__main__":
+    main()
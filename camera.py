@@ -0,0 +1,91 @@
+from math import floor, log
+
+from settings import *
+
+
+class Camera:
+    """ the part of the world shown in the window: the world point at the
+    top left corner of the window and the zoom (window pixels per world
+    unit). The zoom moves in CAMERA_ZOOM_STEP steps, so the creatures are
+    drawn at a few sizes the sprite cache can keep """
+
+    def __init__(self, view_width=None, view_height=None, world_width=None,
+                 world_height=None):
+        # the window and the world of the settings by default
+        self.view_width = view_width = view_width or WIN_WIDTH
+        self.view_height = view_height = view_height or WIN_HEIGHT
+        self.world_width = world_width = world_width or WORLD_WIDTH
+        self.world_height = world_height = world_height or WORLD_HEIGHT
+
+        # zoom levels: zoom = CAMERA_ZOOM_STEP ** level, the farthest one
+        # shows the whole world, and never farther than 1 if it fits
+        fit = min(1, view_width / world_width, view_height / world_height)
+        self.min_level = floor(log(fit) / log(CAMERA_ZOOM_STEP))
+        self.max_level = max(0, floor(log(CAMERA_MAX_ZOOM) / log(CAMERA_ZOOM_STEP)))
+        self.level = 0
+        self.zoom = 1.0
+
+        # starts at the center of the world
+        self.x = (world_width - view_width) / 2
+        self.y = (world_height - view_height) / 2
+        self.clamp()
+
+    def view(self):
+        """ changes when the camera moves, to know if drawn positions are still valid """
+        return self.x, self.y, self.zoom
+
+    def clamp(self):
+        """ keeps the view inside the world, centered on it if it's smaller """
+        width = self.view_width / self.zoom
+        height = self.view_height / self.zoom
+        if width >= self.world_width:
+            self.x = (self.world_width - width) / 2
+        else:
+            self.x = min(max(self.x, 0), self.world_width - width)
+        if height >= self.world_height:
+            self.y = (self.world_height - height) / 2
+        else:
+            self.y = min(max(self.y, 0), self.world_height - height)
+
+    def pan(self, dx, dy):
+        """ moves the view dx, dy window pixels """
+        self.x += dx / self.zoom
+        self.y += dy / self.zoom
+        self.clamp()
+
+    def zoom_at(self, steps, sx, sy):
+        """ zooms in (steps > 0) or out, the world point under the window
+        pixel sx, sy stays there """
+        level = min(max(self.level + steps, self.min_level), self.max_level)
+        if level == self.level:
+            return
+        x, y = self.to_world(sx, sy)
+        self.level = level
+        self.zoom = CAMERA_ZOOM_STEP ** level
+        self.x = x - sx / self.zoom
+        self.y = y - sy / self.zoom
+        self.clamp()
+
+    def fit(self):
+        """ the whole world in the window """
+        self.level = self.min_level
+        self.zoom = CAMERA_ZOOM_STEP ** self.level
+        self.clamp()
+
+    def to_screen(self, x, y):
+        return (x - self.x) * self.zoom, (y - self.y) * self.zoom
+
+    def to_world(self, sx, sy):
+        return self.x + sx / self.zoom, self.y + sy / self.zoom
+
+    def bounds(self, margin=0):
+        """ left, top, right, bottom of the view in world coordinates,
+        widened by margin world units """
+        return (self.x - margin, self.y - margin,
+                self.x + self.view_width / self.zoom + margin,
+                self.y + self.view_height / self.zoom + margin)
+
+    def sees(self, x, y, radius):
+        """ true if a circle at x, y intersects the view (its bounding box does) """
+        left, top, right, bottom = self.bounds(radius)
+        return left <= x <= right and top <= y <= bottom
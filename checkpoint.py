@@ -0,0 +1,338 @@
+""" checkpoints of a running world
+
+A checkpoint is everything needed to resume a run exactly where it was:
+the random generators, the creatures (alive, waiting for the next
+generation or kept as records), the foods, the running stats and the
+history records not written to the outputs yet. It is a pickle of plain
+numpy arrays and numbers, written to a temporary file and renamed over the
+old checkpoint, so a crash never leaves half a checkpoint.
+
+The state is copied between two steps (a few milliseconds) and written by
+the background writer after the pending saves, so the sizes of the history
+outputs it records are the ones that match the saved records. Resuming
+truncates the outputs back to those sizes, reads the written records back
+from them and keeps appending to them.
+"""
+import os
+import pickle
+import numpy as np
+
+from settings import *
+from creature import Food
+from datastats import RecordBuffer
+from histfile import open_history
+from world import World
+from vecworld import VecWorld, STATE_FIELDS
+
+MAGIC = b"FCCKPT01"
+FORMAT_VERSION = 1
+BACKENDS = {"World": World, "VecWorld": VecWorld}
+
+# where a creature of the checkpoint comes from
+ALIVE = 0
+BY_GEN = 1  # dead, waiting for the next generation (ds.temp_hist_by_gen)
+RECORD = 2  # dead, only kept as ds.fittest or ds.current_fittest
+
+
+def creature_dtype(dna_size=None):
+    dna_size = DNA_SIZE if dna_size is None else dna_size
+    return np.dtype([
+        ("where", "u1"),
+        ("slot", "i8"),  # row in the VecWorld arrays, -1 if none
+        ("dna", "f8", (dna_size,)),
+        ("pos", "f8", (2,)),
+        ("vel", "f8", (2,)),
+        ("desired", "f8", (2,)),
+        ("wander_ring_pos", "f8", (2,)),
+        ("wander_at_pos", "?"),  # the wander ring is centered on the creature
+        ("health", "f8"),
+        ("age", "f8"),
+        ("food_eaten", "i8"),
+        ("poison_eaten", "i8"),
+        ("childs", "i8"),
+        ("gen", "i8"),
+        ("last_wr_time", "i8"),
+        ("chance", "f8"),  # By Gen breeding chance
+    ])
+
+
+FOOD_DTYPE = np.dtype([
+    ("pos", "f8", (2,)),
+    ("size", "i8"),
+    ("is_poison", "?"),
+    ("slot", "i8"),
+])
+
+
+def _slot(obj):
+    slot = getattr(obj, "slot", None)
+    return -1 if slot is None else slot
+
+
+def capture(world):
+    """ copy of the state of the world, to be taken between two steps """
+    ds = world.ds
+
+    # every creature the world or its stats still refer to, once
+    creatures = []
+    index = {}
+
+    def add(c, where, chance=0.0):
+        if id(c) not in index:
+            index[id(c)] = len(creatures)
+            creatures.append((c, where, chance))
+
+    for c in world.all_creatures:
+        add(c, ALIVE)
+    for c, chance in ds.temp_hist_by_gen.items():
+        add(c, BY_GEN, chance)
+    for c in (ds.fittest, ds.current_fittest):
+        if c is not None:
+            add(c, RECORD)
+
+    creature_rows = np.zeros(len(creatures), dtype=creature_dtype(DNA_SIZE))
+    creature_rows["where"] = [where for _, where, _ in creatures]
+    creature_rows["chance"] = [chance for _, _, chance in creatures]
+    creature_rows["slot"] = [_slot(c) for c, _, _ in creatures]
+    if creatures:
+        creature_rows["dna"] = [c.dna for c, _, _ in creatures]
+    creature_rows["childs"] = [c.childs for c, _, _ in creatures]
+    creature_rows["gen"] = [c.gen for c, _, _ in creatures]
+
+    # the state of the creatures attached to a VecWorld is copied from its
+    # arrays, the rest one by one
+    slots = creature_rows["slot"]
+    attached = slots >= 0
+    if attached.any():
+        for name in STATE_FIELDS:
+            creature_rows[name][attached] = world.creatures.arrays[name][slots[attached]]
+    loose = [creatures[i][0] for i in np.flatnonzero(~attached)]
+    if loose:
+        rows = creature_rows[~attached]
+        rows["pos"] = [(c.x, c.y) for c in loose]
+        rows["vel"] = [(c.vel_x, c.vel_y) for c in loose]
+        rows["desired"] = [(c.desired_x, c.desired_y) for c in loose]
+        rows["wander_ring_pos"] = [(c.wander_x, c.wander_y) for c in loose]
+        rows["wander_at_pos"] = [c.wander_at_pos for c in loose]
+        for name in ("health", "age", "food_eaten", "poison_eaten", "last_wr_time"):
+            rows[name] = [getattr(c, name) for c in loose]
+        creature_rows[~attached] = rows
+
+    foods = list(world.all_foods)
+    food_rows = np.zeros(len(foods), dtype=FOOD_DTYPE)
+    for i, f in enumerate(foods):
+        food_rows[i] = ((f.x, f.y), f.size, f.is_poison, _slot(f))
+
+    state = {
+        "version": FORMAT_VERSION,
+        "backend": type(world).__name__,
+        "seed": world.seed,
+        "rng": world.rng.getstate(),
+        "np_rng": world.np_rng.bit_generator.state,
+        "ticks": world.ticks,
+        "clock": world.clock,
+        "steps": world.steps,
+        "generation": world.generation,
+        "spawn_mode": world.spawn_mode,
+        "save_to_csv": world.save_to_csv,
+        "immigrants": [list(dna) for dna in world.immigrants],
+        "creatures": creature_rows,
+        "foods": food_rows,
+        "fittest": -1 if ds.fittest is None else index[id(ds.fittest)],
+        "current_fittest": -1 if ds.current_fittest is None else index[id(ds.current_fittest)],
+        "fitness_record": ds.fitness_record,
+        "oldest_age": ds.oldest_age,
+        "hall_of_fame": list(ds.hall_of_fame),
+        "last_save": ds.last_save,
+        "means": list(ds.means),
+        "medians": list(ds.medians),
+        # only the records not written yet, the written ones are read back
+        # from the outputs when resuming. Views, appended records never
+        # change, so copying them doesn't make the pause longer
+        "history": ds.history.unsaved(),
+        "history_saved": ds.history.saved,
+        "stats_history": ds.stats_history.unsaved(),
+        "stats_history_saved": ds.stats_history.saved,
+        # the running stats keep changing, pickled now. The medians of the
+        # whole history hold every value, only the counts and means are
+        # kept and the medians are loaded from the history when resuming
+        "stream_stats": [(s.count, s.mean) for s in ds.stream_stats],
+        "running_stats": pickle.dumps((ds.window_stats, ds.window_means,
+                                       ds.window_medians)),
+        "save_format": ds.save_format,
+        "outputs": [ds.csv_name1, ds.csv_name2, ds.bin_name1, ds.bin_name2],
+    }
+    return state
+
+
+def write_checkpoint(path, state, fsync=True):
+    """ writes the checkpoint atomically. Any pending save must be done
+    before, the current sizes of the outputs are stored with it """
+    state["output_sizes"] = {name: os.path.getsize(name) if os.path.exists(name) else 0
+                             for name in state["outputs"]}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def save_checkpoint(world, path, fsync=None):
+    """ copies the state of the world and writes it in the background
+    writer (if enabled) after the pending saves """
+    fsync = WRITER_FSYNC if fsync is None else fsync
+    ds = world.ds
+    if world.save_to_csv:
+        ds.save()
+    state = capture(world)
+    if ds.background_writer:
+        ds.start_writer().submit(write_checkpoint, path, state, fsync)
+    else:
+        write_checkpoint(path, state, fsync)
+
+
+def read_checkpoint(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a checkpoint")
+        return pickle.load(f)
+
+
+def rewind_outputs(sizes):
+    """ drops what was written to the outputs after the checkpoint, the
+    resumed world writes it again """
+    for name, size in sizes.items():
+        if os.path.exists(name) and os.path.getsize(name) > size:
+            os.truncate(name, size)
+
+
+def saved_records(paths, dtype, count):
+    """ the first count records written to the outputs, read back from the
+    first of paths (binary or csv) that has them all """
+    if not count:
+        return np.zeros(0, dtype=dtype)
+    for path in paths:
+        if not os.path.exists(path) or not os.path.getsize(path):
+            continue
+        records = np.zeros(count, dtype=dtype)
+        start = 0
+        for chunk in open_history(path).chunks():
+            rows = min(len(chunk[dtype.names[0]]), count - start)
+            for name in dtype.names:
+                records[name][start:start + rows] = chunk[name][:rows]
+            start += rows
+            if start == count:
+                break
+        if start == count:
+            return records
+    raise ValueError(f"the outputs of the checkpoint don't have its {count} saved records")
+
+
+def _record_buffer(saved, unsaved):
+    n = len(saved) + len(unsaved)
+    buffer = RecordBuffer(unsaved.dtype, capacity=max(1024, n))
+    buffer.data[:len(saved)] = saved
+    buffer.data[len(saved):n] = unsaved
+    buffer.n = n
+    buffer.saved = len(saved)
+    return buffer
+
+
+def restore(world, state):
+    """ puts the state of a checkpoint into a new world """
+    ds = world.ds
+    world.rng.setstate(state["rng"])
+    if state["np_rng"] is not None:
+        world.np_rng.bit_generator.state = state["np_rng"]
+    world.ticks = state["ticks"]
+    # the leaderboard ranks the creatures by the clock when they are added
+    world.clock = state.get("clock", world.ticks / 1000)
+    world.steps = state["steps"]
+    world.generation = state["generation"]
+    world.immigrants = [list(dna) for dna in state["immigrants"]]
+    world.last_checkpoint = world.ticks
+
+    creatures = []
+    for row in state["creatures"]:
+        c = world.new_creature(row["pos"].tolist(), row["dna"].tolist())
+        c.vel_x, c.vel_y = row["vel"].tolist()
+        c.desired_x, c.desired_y = row["desired"].tolist()
+        c.wander_x, c.wander_y = row["wander_ring_pos"].tolist()
+        c.wander_at_pos = bool(row["wander_at_pos"])
+        c.health = float(row["health"])
+        c.age = float(row["age"])
+        c.food_eaten = int(row["food_eaten"])
+        c.poison_eaten = int(row["poison_eaten"])
+        c.childs = int(row["childs"])
+        c.gen = int(row["gen"])
+        c.last_wr_time = int(row["last_wr_time"])
+        c.update_fitness()
+        creatures.append(c)
+
+    rows = state["creatures"]
+    alive = [(c, row["slot"]) for c, row in zip(creatures, rows) if row["where"] == ALIVE]
+    for c, _ in alive:
+        world.add_creature(c)
+    ds.temp_hist_by_gen = {c: float(row["chance"]) for c, row in zip(creatures, rows)
+                           if row["where"] == BY_GEN}
+    if state["fittest"] >= 0:
+        ds.fittest = creatures[state["fittest"]]
+    if state["current_fittest"] >= 0:
+        ds.current_fittest = creatures[state["current_fittest"]]
+
+    foods = []
+    for row in state["foods"]:
+        food = Food(row["pos"].tolist(), int(row["size"]), bool(row["is_poison"]))
+        world.add_food(food)
+        foods.append((food, row["slot"]))
+
+    # the batched backend also needs the rows in the same order
+    if isinstance(world, VecWorld) and state["backend"] == "VecWorld":
+        world.restore_order([c for c, _ in sorted(alive, key=lambda item: item[1])],
+                            [f for f, _ in sorted(foods, key=lambda item: item[1])])
+
+    ds.fitness_record = state["fitness_record"]
+    ds.oldest_age = state["oldest_age"]
+    ds.hall_of_fame = list(state.get("hall_of_fame", []))
+    ds.last_save = state["last_save"]
+    ds.means = list(state["means"])
+    ds.medians = list(state["medians"])
+    (ds.window_stats, ds.window_means,
+     ds.window_medians) = pickle.loads(state["running_stats"])
+    window = ds.window_stats[0] if ds.window_stats else None
+    ds.window_size = getattr(window, "size", 0)
+    ds.window_generations = getattr(window, "generations", 0)
+
+    # keep appending to the same outputs
+    ds.save_format = state["save_format"]
+    ds.csv_name1, ds.csv_name2, ds.bin_name1, ds.bin_name2 = state["outputs"]
+    rewind_outputs(state["output_sizes"])
+    history = saved_records((ds.bin_name1, ds.csv_name1), state["history"].dtype,
+                            state["history_saved"])
+    stats = saved_records((ds.bin_name2, ds.csv_name2), state["stats_history"].dtype,
+                          state["stats_history_saved"])
+    ds.history = _record_buffer(history, state["history"])
+    ds.stats_history = _record_buffer(stats, state["stats_history"])
+    # a column of the history per stream (see HEADER1, without Time)
+    for s, (count, mean), name in zip(ds.stream_stats, state["stream_stats"],
+                                      ds.history.data.dtype.names[1:]):
+        s.count, s.mean = count, mean
+        s.load(ds.history.column(name))
+    ds.header_saved = [os.path.exists(name) and os.path.getsize(name) > 0
+                       for name in (ds.csv_name1, ds.csv_name2)]
+
+
+def load_checkpoint(path, world_class=None):
+    """ a new world resumed from the checkpoint in path, of the backend it
+    was saved from unless world_class is given """
+    state = read_checkpoint(path)
+    if world_class is None:
+        world_class = BACKENDS[state["backend"]]
+    world = world_class(spawn_mode=state["spawn_mode"], save_to_csv=state["save_to_csv"],
+                        seed=state["seed"])
+    restore(world, state)
+    world.checkpoint_path = path
+    return world
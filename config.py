@@ -0,0 +1,140 @@
+""" settings of a run
+
+The modules read the values of settings.py as their own globals (they do
+"from settings import *"). A Config is a set of changes to those values
+for one run: it checks the names, recomputes the values derived from
+others (e.g. DISTANCE_BETWEEN_SPRITES from MAX_CREATURE_SIZE) and is
+applied to the already imported modules and undone afterwards, so the
+worker processes of batch.py and sweep.py run any number of configurations
+without importing anything again. It pickles as a plain dict.
+"""
+import os
+import sys
+from contextlib import contextmanager
+
+import settings
+
+# settings only read when the modules are imported (the columns of the
+# history files and the dna length that goes with them), a Config can't
+# change them
+IMPORT_TIME = ("HEADER1", "HEADER2", "DNA_SIZE")
+
+# settings computed from others in settings.py, recomputed by Config in
+# this order (a value can depend on the ones above it)
+DERIVED = {
+    "SIM_DT": lambda v: 1 / v["FPS"],
+    "DISTANCE_BETWEEN_SPRITES": lambda v: (v["MAX_CREATURE_SIZE"] // 2) + 1,
+    "WORLD_WIDTH": lambda v: v["WIN_WIDTH"],
+    "WORLD_HEIGHT": lambda v: v["WIN_HEIGHT"],
+    "WANDER_RING_DISTANCE": lambda v: (v["WORLD_WIDTH"] + v["WORLD_HEIGHT"]) // 8,
+    "WANDER_RING_RADIUS": lambda v: (v["WORLD_WIDTH"] + v["WORLD_HEIGHT"]) // 4,
+}
+
+
+def parse_value(text):
+    """ NAME=VALUE values from the command line: int, float, bool or str """
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    if text in ("True", "False"):
+        return text == "True"
+    return text
+
+
+def parse_assignments(items):
+    """ {NAME: value} of a list of NAME=VALUE strings """
+    values = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        values[name] = parse_value(value)
+    return values
+
+
+def settings_modules():
+    """ the imported modules of the program (the ones next to settings.py,
+    __main__ too when it's one of them), the ones that can hold a copy of
+    the settings """
+    folder = os.path.dirname(os.path.abspath(settings.__file__))
+    modules = []
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if path and os.path.dirname(os.path.abspath(path)) == folder:
+            modules.append(module)
+    return modules
+
+
+def apply_overrides(overrides):
+    """ sets the given settings in every module that holds them (copied
+    with "from settings import ..." or read as settings.NAME), returns the
+    previous values so they can be restored. Values derived from others
+    at import time (e.g. DISTANCE_BETWEEN_SPRITES) don't change, see Config """
+    modules = settings_modules()
+    previous = {}
+    for name, value in overrides.items():
+        if not hasattr(settings, name):
+            raise ValueError(f"unknown setting: {name}")
+        current = previous[name] = getattr(settings, name)
+        # the modules read the settings when they use them, never as
+        # default values of arguments, so this reaches every object made
+        # after it
+        for module in modules:
+            if name in vars(module) and vars(module)[name] is current:
+                setattr(module, name, value)
+    return previous
+
+
+class Config:
+    """ values of settings.py changed for a run """
+
+    def __init__(self, overrides=None):
+        self.overrides = dict(overrides or {})
+        unknown = [name for name in self.overrides
+                   if not name.isupper() or not hasattr(settings, name)]
+        if unknown:
+            raise ValueError(f"unknown settings: {', '.join(unknown)}")
+        fixed = [name for name in self.overrides if name in IMPORT_TIME]
+        if fixed:
+            raise ValueError(f"settings that can't change for a run: {', '.join(fixed)}")
+
+    def __repr__(self):
+        return f"Config({self.overrides})"
+
+    def __eq__(self, other):
+        return isinstance(other, Config) and self.overrides == other.overrides
+
+    def __hash__(self):
+        return hash(tuple(sorted(self.overrides.items())))
+
+    def label(self):
+        return " ".join(f"{name}={value}" for name, value in self.overrides.items())
+
+    def merged(self, overrides):
+        """ a new Config with more (or other) values """
+        return Config({**self.overrides, **overrides})
+
+    def changes(self):
+        """ the overrides plus the derived values they change """
+        values = {name: getattr(settings, name) for name in dir(settings) if name.isupper()}
+        values.update(self.overrides)
+        changes = dict(self.overrides)
+        for name, compute in DERIVED.items():
+            if name not in self.overrides:
+                value = compute(values)
+                values[name] = value
+                if value != getattr(settings, name):
+                    changes[name] = value
+        return changes
+
+    def get(self, name):
+        return self.changes().get(name, getattr(settings, name))
+
+    @contextmanager
+    def applied(self):
+        """ the modules use these values inside the with block """
+        previous = apply_overrides(self.changes())
+        try:
+            yield self
+        finally:
+            apply_overrides(previous)
@@ -0,0 +1,277 @@
+import random
+from math import sqrt
+
+from settings import *
+from vector import length, angle_of, scaled_to, clamped, rotated
+from eventlog import SILENT, MUTATION
+
+
+def translate(value, left_min, left_max, right_min, right_max):
+    """ returns scaled value from the ranges of the left to right """
+    # Figure out how 'wide' each range is
+    left_span = left_max - left_min
+    right_span = right_max - right_min
+    # Convert the left range into a 0-1 range (float)
+    value_scaled = float(value - left_min) / float(left_span)
+    # Convert the 0-1 range into a value in the right range.
+    return right_min + (value_scaled * right_span)
+
+
+class Creature:
+    """ plain fields only, vectors are stored as their x and y. Nothing
+    here is for drawing, see sprites.EntitySprites """
+
+    __slots__ = ("rng", "log", "dna", "max_vel", "max_health", "size", "radius",
+                 "food_attraction", "poison_attraction", "food_dist", "poison_dist",
+                 "max_steer_force", "dir_angle_mult", "x", "y", "vel_x", "vel_y",
+                 "acc_x", "acc_y", "desired_x", "desired_y", "age", "food_eaten",
+                 "poison_eaten", "childs", "gen", "fitness_value", "health",
+                 "last_wr_time", "wander_x", "wander_y", "wander_at_pos")
+
+    def __init__(self, pos, dna=None, rng=random, log=SILENT):
+        # source of randomness, the world's own random.Random
+        self.rng = rng
+        # the world's eventlog.EventLog
+        self.log = log
+
+        self.dna = []
+        # if we don't have dna, create a random one
+        if dna is None:
+            for _ in range(DNA_SIZE):
+                self.dna.append(rng.random())
+        else:
+            self.dna = dna
+
+        # Apply dna values !!
+        # dna[0] maps size, max_health and max_vel
+        max_vel_value = TOTAL_MAXVEL_MAXHP_POINTS - MIN_HP
+        self.max_vel = translate(self.dna[0], 0, 1, MIN_HP, max_vel_value)
+        self.max_health = TOTAL_MAXVEL_MAXHP_POINTS - self.max_vel
+        self.size = int(translate(self.max_health, MIN_HP, max_vel_value,
+                                  MIN_CREATURE_SIZE, MAX_CREATURE_SIZE))
+
+        # we need to calc this when we have the creature size
+        # Guarantee odd number, for drawing
+        if self.size % 2 == 0:
+            self.size += 1
+        radius = (self.size - 1) // 2
+        self.radius = radius
+
+        # keep applying DNA values
+        self.food_attraction = translate(self.dna[1], 0, 1, -20, 20)
+        self.poison_attraction = translate(self.dna[2], 0, 1, -20, 20)
+        self.food_dist = translate(
+            self.dna[3], 0, 1, self.radius, MAX_PERCEPTION_DIST)
+        self.poison_dist = translate(
+            self.dna[4], 0, 1, self.radius, MAX_PERCEPTION_DIST)
+        self.max_steer_force = translate(self.dna[5], 0, 1, 1, MAX_STEER_FORCE)
+        self.dir_angle_mult = translate(
+            self.dna[6], 0, 1, MIN_DIR_ANGLE_MULT, MAX_DIR_ANGLE_MULT)
+
+        self.x, self.y = float(pos[0]), float(pos[1])
+        self.vel_x = self.vel_y = 0.0
+        self.acc_x = self.acc_y = 0.0
+        self.desired_x = self.desired_y = 0.0  # drawing purposes
+        self.age = 0
+        self.food_eaten = 0
+        self.poison_eaten = 0
+        self.childs = 0
+        self.gen = 0
+        # sqrt(age + food_eaten * 2 - poison_eaten), see update_fitness
+        self.fitness_value = 0.0
+
+        self.health = self.max_health
+
+        self.last_wr_time = 0
+        # the wander ring is centered on the creature itself until the
+        # first time it wanders
+        self.wander_x, self.wander_y = self.x, self.y
+        self.wander_at_pos = True
+
+    def fitness(self):
+        """ returns fitness value of this creature """
+        return self.fitness_value
+
+    def update_fitness(self):
+        """ recomputes the fitness, called whenever age, food_eaten or
+        poison_eaten change """
+        self.fitness_value = sqrt(max(self.age + (self.food_eaten * 2) - self.poison_eaten, 0))
+
+    def mutate(self, dna):
+        """ returns a mutated (or not) copy of its own dna """
+        # range value in which the dna can mutate
+        mutation_range = MAX_MUTATION_VALUE/((self.fitness()*0.1)**2 + 1)
+        for i in range(DNA_SIZE):
+            if self.rng.random() < MUTATION_CHANCE:
+                # random offset based on mutation range
+                offset = translate(self.rng.random(),
+                                   0, 1,
+                                   -mutation_range, mutation_range)
+                old = dna[i]
+                # apply the offset
+                dna[i] += offset
+                # ensure we aren't out of limits
+                dna[i] = max(0, min(dna[i], 1))
+                if self.log.enabled[MUTATION]:
+                    self.log.add(MUTATION, id(self), i, mutation_range, offset, old, dna[i])
+        return dna
+
+    def breed(self, forced_chance=None):
+        # higher fitness = higher chance to breed
+        x = self.fitness()
+        chance = (x / (BREED_CHANCE_VALUE + x))
+
+        # used in By Gen mode:
+        if forced_chance is not None:
+            chance = forced_chance
+
+        if self.rng.random() < chance:
+            return self.mutate(self.dna.copy())
+        return None
+
+    def seek(self, target_x, target_y):
+        desired_x, desired_y = target_x - self.x, target_y - self.y
+        dist = length(desired_x, desired_y)
+        if dist > 0.001:
+            desired_x, desired_y = desired_x / dist * self.max_vel, desired_y / dist * self.max_vel
+        self.desired_x, self.desired_y = desired_x, desired_y
+        return clamped(desired_x - self.vel_x, desired_y - self.vel_y, self.max_steer_force)
+
+    def wander_by_ring(self, now):
+        # now is the simulated time in milliseconds
+        if now - self.last_wr_time > WANDER_RING_WAIT:
+            self.last_wr_time = now
+            new_x = float(self.rng.randint(0, int(WORLD_WIDTH)))
+            new_y = float(self.rng.randint(0, int(WORLD_HEIGHT)))
+            speed = length(self.vel_x, self.vel_y)
+            if speed:
+                self.wander_x = new_x + self.vel_x / speed * WANDER_RING_DISTANCE
+                self.wander_y = new_y + self.vel_y / speed * WANDER_RING_DISTANCE
+            else:
+                self.wander_x = new_x * WANDER_RING_DISTANCE
+                self.wander_y = new_y * WANDER_RING_DISTANCE
+            self.wander_at_pos = False
+
+        offset_x, offset_y = rotated(float(WANDER_RING_RADIUS), 0.0,
+                                     self.rng.uniform(0, 360))
+        if self.wander_at_pos:
+            target_x, target_y = self.x + offset_x, self.y + offset_y
+        else:
+            target_x, target_y = self.wander_x + offset_x, self.wander_y + offset_y
+
+        # self.wander_target = target  # only for drawing its vector
+        self.apply_force(*self.seek(target_x, target_y))
+
+    def seek_targets(self, targets, now):
+        x, y = self.x, self.y
+
+        # create a dict with all the targets in range
+        targets_inrange = {}
+        for t in targets:
+            dist = length(x - t.x, y - t.y)
+            if t.is_poison:
+                if dist <= self.poison_dist:
+                    targets_inrange[t] = dist
+            else:
+                if dist <= self.food_dist:
+                    targets_inrange[t] = dist
+
+        if targets_inrange:
+            # we start with a force of 0 length
+            desired_x = desired_y = 0.0
+            # the direction we are going, to compare with the targets
+            angle = angle_of(self.vel_x, self.vel_y)
+            min_dist = min(targets_inrange.values())
+            for t, dist in targets_inrange.items():
+                # get the desired vector to the target pos
+                force_x, force_y = t.x - x, t.y - y
+                # normalize it if possible
+                if length(force_x, force_y) > 0.001:
+                    force_x, force_y = scaled_to(force_x, force_y, self.max_vel)
+
+                # calculate the difference in angle between
+                # the target and our velocity, less difference will have
+                # a priority (targets we have in front)
+                angle_diff = abs(angle - angle_of(force_x, force_y))
+
+                min_dist_mult = 1
+                if dist == min_dist:
+                    min_dist_mult = 2
+
+                if t.is_poison:
+                    attraction = self.poison_attraction * min_dist_mult
+                else:
+                    attraction = self.food_attraction * min_dist_mult
+
+                # adjust vector with distance and dir angle
+                # the higher dir_angle_mult a creature has, the higher priority
+                # targets in front of it will have (i'm proud of this ^^)
+                # (multiplied by the inverse, as pygame's Vector2 divides)
+                inverse = 1. / (1 + dist + sqrt(angle_diff * self.dir_angle_mult))
+
+                # sum all the force
+                desired_x += force_x * attraction * inverse
+                desired_y += force_y * attraction * inverse
+
+            # in case force is too low
+            desired_x, desired_y = clamped(desired_x * self.max_vel, desired_y * self.max_vel,
+                                           self.max_vel)
+            self.desired_x, self.desired_y = desired_x, desired_y
+
+            # calc the steer force and apply it to the acc
+            self.apply_force(*clamped(desired_x - self.vel_x, desired_y - self.vel_y,
+                                      self.max_steer_force))
+        else:
+            # nothing in range, go wander
+            self.wander_by_ring(now)
+
+    def apply_force(self, force_x, force_y):
+        self.acc_x += force_x
+        self.acc_y += force_y
+
+    def eat(self, is_poison):
+        if is_poison:
+            self.health += POISON_VALUE
+            self.poison_eaten += 1
+        else:
+            self.health += FOOD_VALUE
+            self.food_eaten += 1
+        self.health = max(0, min(self.health, self.max_health))
+        self.update_fitness()
+
+    def update(self, dt, targets, now):
+        self.seek_targets(targets, now)
+
+        self.vel_x, self.vel_y = clamped(self.vel_x + self.acc_x, self.vel_y + self.acc_y,
+                                         self.max_vel)
+
+        self.x += self.vel_x * dt
+        self.y += self.vel_y * dt
+
+        self.health -= HEALTH_DEGENERATION * dt
+        self.acc_x *= 0  # RESET ACC
+        self.acc_y *= 0
+        self.age += dt
+        self.update_fitness()
+
+    def is_dead(self):
+        return self.health <= 0
+
+
+class Food:
+    __slots__ = ("x", "y", "size", "radius", "is_poison", "slot")
+
+    def __init__(self, pos, size, is_poison=False):
+        # Guarantee odd number, for drawing
+        if size % 2 == 0:
+            size += 1
+
+        radius = (size - 1) // 2
+        self.radius = radius
+        self.size = size
+
+        self.is_poison = is_poison
+
+        self.x, self.y = float(pos[0]), float(pos[1])
+        # row in the VecWorld arrays
+        self.slot = None
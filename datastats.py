@@ -1,6 +1,14 @@
 import csv
+import heapq
+import math
+import os
+from collections import deque
 import numpy as np
-from settings import STARTTIME, HEADER1, HEADER2, DNA_SIZE
+from settings import (run_prefix, HEADER1, HEADER2, DNA_SIZE, STATS_WINDOW,
+                      STATS_WINDOW_GENERATIONS, SAVE_FORMAT, BACKGROUND_WRITER,
+                      WRITER_QUEUE_SIZE, WRITER_FSYNC, LEADERBOARD_SIZE)
+from histfile import HISTORY_DTYPE, STATS_DTYPE, append_records
+from writer import BackgroundWriter
 
 
 def isfloat(value):
@@ -17,22 +25,273 @@ def column(matrix, i):
     return [row[i] for row in matrix if isfloat(row[i])]
 
 
+class RecordBuffer:
+    """ growable array of typed records (a numpy structured array), the
+    capacity doubles when it's full so appending is amortized O(1) and
+    there is only one copy of the data """
+
+    def __init__(self, dtype, capacity=1024):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.n = 0
+        self.saved = 0  # records already written to disk
+
+    def __len__(self):
+        return self.n
+
+    def append(self, row):
+        if self.n == len(self.data):
+            grown = np.zeros(len(self.data) * 2, dtype=self.data.dtype)
+            grown[:self.n] = self.data[:self.n]
+            self.data = grown
+        self.data[self.n] = tuple(row)
+        self.n += 1
+
+    @property
+    def records(self):
+        """ view of the stored records, no copy """
+        return self.data[:self.n]
+
+    def column(self, name):
+        """ view of one column, no copy """
+        return self.data[name][:self.n]
+
+    def unsaved(self):
+        """ view of the records not written to disk yet """
+        return self.data[self.saved:self.n]
+
+    def mark_saved(self):
+        self.saved = self.n
+
+
+def creature_info(c):
+    """ the values shown by print_info, copied so they can be printed later """
+    return {
+        "id": id(c), "fitness": c.fitness(), "age": c.age, "food_eaten": c.food_eaten,
+        "poison_eaten": c.poison_eaten, "health": c.health, "gen": c.gen,
+        "childs": c.childs, "dna": list(c.dna), "food_attraction": c.food_attraction,
+        "poison_attraction": c.poison_attraction, "food_dist": c.food_dist,
+        "poison_dist": c.poison_dist, "max_health": c.max_health, "max_vel": c.max_vel,
+        "size": c.size, "max_steer_force": c.max_steer_force,
+        "dir_angle_mult": c.dir_angle_mult,
+    }
+
+
+def info_text(info, timestamp):
+    i = info
+    return (f"\n[{timestamp}] [{i['id']}] [Fitness: {i['fitness']}]\n " +
+            f"Age: {i['age']} seconds, F.Eaten: {i['food_eaten']}, P.Eaten: {i['poison_eaten']}\n" +
+            f"currHP: {i['health']}, Gen: {i['gen']}, Childs: {i['childs']}\n" +
+            f"DNA: {i['dna']}\n" +
+            f"FoodAttr: {i['food_attraction']}, PoisonAttr: {i['poison_attraction']}\n" +
+            f"FoodDist: {i['food_dist']}, PoisonDist: {i['poison_dist']}\n" +
+            f"MaxHealth: {i['max_health']}, MaxVel: {i['max_vel']}, Size: {i['size']}\n" +
+            f"MaxSteer: {i['max_steer_force']}, DirAngleMult: {i['dir_angle_mult']}\n")
+
+
 def print_info(c, timestamp):
     """ print creature info on console """
-    print(f"\n[{timestamp}] [{id(c)}] [Fitness: {c.fitness()}]\n " +
-          f"Age: {c.age} seconds, F.Eaten: {c.food_eaten}, P.Eaten: {c.poison_eaten}\n" +
-          f"currHP: {c.health}, Gen: {c.gen}, Childs: {c.childs}\n" +
-          f"DNA: {c.dna}\n" +
-          f"FoodAttr: {c.food_attraction}, PoisonAttr: {c.poison_attraction}\n" +
-          f"FoodDist: {c.food_dist}, PoisonDist: {c.poison_dist}\n" +
-          f"MaxHealth: {c.max_health}, MaxVel: {c.max_vel}, Size: {c.size}\n" +
-          f"MaxSteer: {c.max_steer_force}, DirAngleMult: {c.dir_angle_mult}\n")
+    print(info_text(creature_info(c), timestamp))
+
+
+class StreamStats:
+    """ running mean and exact median of a stream of values. The values
+    are split in two heaps around the median, the lower half as a max heap
+    (negated values), so adding one is O(log n) and the median is at the
+    tops """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0
+        self.low = []  # -value, the lower half
+        self.high = []  # value, the upper half
+
+    def add(self, x):
+        self.count += 1
+        self.mean += (x - self.mean) / self.count
+        if self.low and x > -self.low[0]:
+            heapq.heappush(self.high, x)
+        else:
+            heapq.heappush(self.low, -x)
+        # the lower half has as many values as the upper one, or one more
+        if len(self.low) > len(self.high) + 1:
+            heapq.heappush(self.high, -heapq.heappop(self.low))
+        elif len(self.high) > len(self.low):
+            heapq.heappush(self.low, -heapq.heappop(self.high))
+
+    def load(self, values):
+        """ the heaps of all the values added so far (a resumed run), the
+        mean and the count are kept as they are """
+        values = np.sort(values).tolist()
+        half = (len(values) + 1) // 2
+        self.low = [-x for x in values[:half]]
+        self.high = values[half:]
+        heapq.heapify(self.low)
+        heapq.heapify(self.high)
+
+    @property
+    def median(self):
+        if not self.low:
+            return 0
+        if len(self.low) > len(self.high):
+            return -self.low[0]
+        return (-self.low[0] + self.high[0]) / 2
+
+
+class SlidingStats:
+    """ exact mean and median of a set of values that come and go. The
+    values are split in two heaps around the median, the lower half as a
+    max heap, and a removed value stays in its heap until it reaches the
+    top (lazy deletion), so adding or removing is O(log n). Every value is
+    a (value, seq) key, unique and totally ordered, so it's known which
+    half it is in. The sum is recomputed exactly every so often, adding
+    and subtracting floats forever would drift """
+
+    def __init__(self):
+        self.low = []  # (-value, -seq), max heap of the lower half
+        self.high = []  # (value, seq), min heap of the upper half
+        self.n_low = 0  # live values in each heap
+        self.n_high = 0
+        self.expired = set()  # seqs removed but still in a heap
+        self.seq = 0
+        self.total = 0
+        self.changes = 0  # adds and removes since the sum was recomputed
+
+    def __len__(self):
+        return self.n_low + self.n_high
+
+    def keys(self):
+        """ (value, seq) of the live values, any order """
+        return ([(-v, -s) for v, s in self.low if -s not in self.expired] +
+                [(v, s) for v, s in self.high if s not in self.expired])
+
+    def prune(self):
+        """ drops the removed values from the tops of the heaps """
+        while self.low and -self.low[0][1] in self.expired:
+            self.expired.remove(-heapq.heappop(self.low)[1])
+        while self.high and self.high[0][1] in self.expired:
+            self.expired.remove(heapq.heappop(self.high)[1])
+
+    def insert(self, x):
+        """ adds x, returns its key for remove() """
+        key = (x, self.seq)
+        self.seq += 1
+        if self.n_low and key > (-self.low[0][0], -self.low[0][1]):
+            heapq.heappush(self.high, key)
+            self.n_high += 1
+        else:
+            heapq.heappush(self.low, (-x, -key[1]))
+            self.n_low += 1
+        self.total += x
+        self.changed()
+        return key
+
+    def remove(self, key):
+        # the tops are live, so the max of the lower half tells the half
+        if self.n_low and key <= (-self.low[0][0], -self.low[0][1]):
+            self.n_low -= 1
+        else:
+            self.n_high -= 1
+        self.expired.add(key[1])
+        self.total -= key[0]
+        self.changed()
+
+    def changed(self):
+        self.prune()
+        # the lower half has as many values as the upper one, or one more
+        while self.n_low > self.n_high + 1:
+            x, seq = heapq.heappop(self.low)
+            heapq.heappush(self.high, (-x, -seq))
+            self.n_low -= 1
+            self.n_high += 1
+            self.prune()
+        while self.n_high > self.n_low:
+            x, seq = heapq.heappop(self.high)
+            heapq.heappush(self.low, (-x, -seq))
+            self.n_high -= 1
+            self.n_low += 1
+            self.prune()
+
+        self.changes += 1
+        # removed values buried in the heaps, or a sum that may have
+        # drifted: rebuild, O(n) every n changes
+        if self.changes > max(len(self), 64) or len(self.expired) > max(len(self), 64):
+            keys = sorted(self.keys())
+            half = (len(keys) + 1) // 2
+            self.low = [(-x, -seq) for x, seq in keys[:half]]
+            self.high = keys[half:]
+            heapq.heapify(self.low)
+            heapq.heapify(self.high)
+            self.n_low, self.n_high = half, len(keys) - half
+            self.expired.clear()
+            self.total = math.fsum(x for x, _ in keys)
+            self.changes = 0
+
+    @property
+    def mean(self):
+        if not len(self):
+            return 0
+        return self.total / len(self)
+
+    @property
+    def median(self):
+        if not len(self):
+            return 0
+        if self.n_low > self.n_high:
+            return -self.low[0][0]
+        return (-self.low[0][0] + self.high[0][0]) / 2
+
+
+class WindowStats(SlidingStats):
+    """ exact mean and median of the last size values """
+
+    def __init__(self, size):
+        super().__init__()
+        self.size = size
+        self.window = deque()  # keys in the order they were added
+
+    def add(self, x):
+        self.window.append(self.insert(x))
+        if len(self.window) > self.size:
+            self.remove(self.window.popleft())
+
+
+class GenerationStats(SlidingStats):
+    """ exact mean and median of the values of the creatures of the last
+    generations generations (the newest generation seen and the ones
+    before it), values of older generations are dropped as newer ones come """
+
+    def __init__(self, generations):
+        super().__init__()
+        self.generations = generations
+        self.newest = None
+        self.by_gen = []  # min heap of (gen, key)
+
+    def add(self, x, gen):
+        if self.newest is None or gen > self.newest:
+            self.newest = gen
+        first = self.newest - self.generations + 1
+        if gen < first:
+            return
+        heapq.heappush(self.by_gen, (gen, self.insert(x)))
+        while self.by_gen[0][0] < first:
+            self.remove(heapq.heappop(self.by_gen)[1])
 
 
 class Datastats:
     """ stores statistics, history and other data from the game """
 
-    def __init__(self):
+    def __init__(self, window_size=None, save_format=None, background_writer=None,
+                 prefix=None, window_generations=None):
+        # the settings of the run by default
+        if window_size is None:
+            window_size = STATS_WINDOW
+        if window_generations is None:
+            window_generations = STATS_WINDOW_GENERATIONS
+        if save_format is None:
+            save_format = SAVE_FORMAT
+        if background_writer is None:
+            background_writer = BACKGROUND_WRITER
+
         self.fittest = None
         self.current_fittest = None
         self.oldest = None
@@ -43,36 +302,97 @@ class Datastats:
         # to the other creatures of the same generation, used in ByGen mode
         self.temp_hist_by_gen = {}
 
-        self.temp_history = []
-        self.history = ([])  # will be np.array
-        self.temp_stats_history = []
-        self.stats_history = ([])  # will be np.array
+        # min heap of the fittest dead creatures: (fitness, -deaths, creature_info)
+        self.hall_of_fame = []
+        self.hall_of_fame_size = LEADERBOARD_SIZE
+
+        self.history = RecordBuffer(HISTORY_DTYPE)
+        self.stats_history = RecordBuffer(STATS_DTYPE)
         self.last_save = 0
         self.header_saved = [False, False]
 
-        self.csv_name1 = STARTTIME + "_history.csv"
-        self.csv_name2 = STARTTIME + "_stats.csv"
+        self.save_format = save_format  # "csv", "bin" or "both"
+        # files of this run, see run_prefix
+        if prefix is None:
+            prefix = run_prefix()
+        self.csv_name1 = prefix + "_history.csv"
+        self.csv_name2 = prefix + "_stats.csv"
+        self.bin_name1 = prefix + "_history.bin"
+        self.bin_name2 = prefix + "_stats.bin"
+
+        # file writes and console stats go through a writer thread,
+        # started on the first save
+        self.background_writer = background_writer
+        self.writer = None
 
         # see HEADER1 & 2 for order (excluding time)
         self.means = [0 for _ in range(len(HEADER1) - 1)]
         self.medians = [0 for _ in range(len(HEADER1) - 1)]
 
+        # updated on every append_to_hist, so calc_stats doesn't have to
+        # go through the whole history
+        self.stream_stats = [StreamStats() for _ in range(len(HEADER1) - 1)]
+        # optional stats of the last window_size deaths, or of the deaths
+        # of the last window_generations generations
+        self.window_size = window_size
+        self.window_generations = window_generations
+        self.window_stats = []
+        if window_generations:
+            self.window_stats = [GenerationStats(window_generations)
+                                 for _ in range(len(HEADER1) - 1)]
+        elif window_size:
+            self.window_stats = [WindowStats(window_size)
+                                 for _ in range(len(HEADER1) - 1)]
+        self.window_means = [0 for _ in range(len(self.window_stats))]
+        self.window_medians = [0 for _ in range(len(self.window_stats))]
+
     def append_to_hist(self, c, timestamp):
-        row = [timestamp, c.fitness(), c.age, c.gen, c.childs,
+        fitness = c.fitness()
+        row = [timestamp, fitness, c.age, c.gen, c.childs,
                c.food_eaten, c.poison_eaten]
 
+        # the older one stays on ties
+        if len(self.hall_of_fame) < self.hall_of_fame_size:
+            heapq.heappush(self.hall_of_fame, (fitness, -self.history.n, creature_info(c)))
+        elif self.hall_of_fame_size and fitness > self.hall_of_fame[0][0]:
+            heapq.heapreplace(self.hall_of_fame, (fitness, -self.history.n, creature_info(c)))
+
         for i in range(DNA_SIZE):
             row.append(c.dna[i])
-        self.temp_history.append(row)
-        # using numpy for history
-        row = np.array(row)
-        # if history is still a list, it's empty
-        if isinstance(self.history, list):
-            self.history = row
+        self.history.append(row)
+
+        for i, value in enumerate(row[1:]):
+            self.stream_stats[i].add(value)
+            if self.window_generations:
+                self.window_stats[i].add(value, c.gen)
+            elif self.window_stats:
+                self.window_stats[i].add(value)
+
+    def save(self):
+        """ writes the records not saved yet in the selected format(s) """
+        # records are never modified once appended, the views stay valid
+        # even if the buffers grow meanwhile
+        history = self.history.unsaved()
+        stats = self.stats_history.unsaved()
+        self.history.mark_saved()
+        self.stats_history.mark_saved()
+        if self.background_writer:
+            self.start_writer().submit(self.write_records, history, stats, WRITER_FSYNC,
+                                       rows=len(history) + len(stats))
         else:
-            self.history = np.vstack((self.history, row))
+            self.write_records(history, stats)
 
-    def save_csv(self):
+    def write_records(self, history, stats, fsync=False):
+        if self.save_format in ("bin", "both"):
+            self.save_bin(history, stats, fsync)
+        if self.save_format in ("csv", "both"):
+            self.save_csv(history, stats, fsync)
+
+    def save_bin(self, history, stats, fsync=False):
+        append_records(self.bin_name1, history, fsync)
+        append_records(self.bin_name2, stats, fsync)
+
+    def save_csv(self, history, stats, fsync=False):
         with open(self.csv_name1, mode='a', newline='') as data_file:
             data_writer = csv.writer(
                 data_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
@@ -80,9 +400,10 @@ class Datastats:
             if not self.header_saved[0]:
                 data_writer.writerow(HEADER1)
                 self.header_saved[0] = True
-            for line in self.temp_history:
-                data_writer.writerow(line)
-        self.temp_history.clear()
+            data_writer.writerows(history.tolist())
+            if fsync:
+                data_file.flush()
+                os.fsync(data_file.fileno())
         with open(self.csv_name2, mode='a', newline='') as data_file:
             data_writer = csv.writer(
                 data_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
@@ -90,48 +411,73 @@ class Datastats:
             if not self.header_saved[1]:
                 data_writer.writerow(HEADER2)
                 self.header_saved[1] = True
-            for line in self.temp_stats_history:
-                data_writer.writerow(line)
-        self.temp_stats_history.clear()
+            data_writer.writerows(stats.tolist())
+            if fsync:
+                data_file.flush()
+                os.fsync(data_file.fileno())
+
+    def start_writer(self):
+        if self.writer is None:
+            self.writer = BackgroundWriter(WRITER_QUEUE_SIZE)
+        return self.writer
+
+    def output(self, text):
+        """ console output, in the writer thread if there is one """
+        if self.background_writer:
+            self.start_writer().submit(print, text)
+        else:
+            print(text)
+
+    def close(self):
+        """ waits for the pending writes and stops the writer thread """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
 
     def calc_fitness_by_gen(self):
         """ gives each creatures in the dict a chance being it higher
         the higher fitness that creatures has """
+        # fitness of each one, and their sum
+        fitness = {c: c.fitness() for c in self.temp_hist_by_gen}
         f_sum = 0
-        # first loop gives us the sum of the fitness
-        for c, _ in self.temp_hist_by_gen.items():
-            f_sum += c.fitness()
+        for f in fitness.values():
+            f_sum += f
         # now we calc the chances by fitness of each one
-        for c, _ in self.temp_hist_by_gen.items():
-            self.temp_hist_by_gen[c] = c.fitness() / f_sum
+        for c, f in fitness.items():
+            self.temp_hist_by_gen[c] = f / f_sum
 
     def calc_stats(self, timestamp):
-        # we have data if history is already an np.array
-        if isinstance(self.history, np.ndarray):
+        # we have data if something was appended to the history
+        if self.stream_stats[0].count:
             row = []
             row.append(timestamp)
             for i in range(len(self.means)):
-
-                # Slower:
-                # self.means[i] = np.mean(column(self.history, i+1))
-                # self.medians[i] = np.median(column(self.history, i+1))
-
-                self.means[i] = np.mean(self.history[:, i+1])
-                self.medians[i] = np.median(self.history[:, i+1])
+                # running values, O(1) no matter how long the history is
+                self.means[i] = self.stream_stats[i].mean
+                self.medians[i] = self.stream_stats[i].median
                 row.append(self.means[i])
                 row.append(self.medians[i])
 
-            self.temp_stats_history.append(row)
-            row = np.array(row)
-            if isinstance(self.stats_history, np.ndarray):
-                np.vstack((self.stats_history, row))
-            else:
-                self.stats_history = row
-
-        print("~~~~~~~~~~")
-        print(f"Mean Fitness:\t{self.means[0]}")
-        print(f"Median Fitness:\t{self.medians[0]}")
-        print("~~~~~~~~~~")
+            for i in range(len(self.window_stats)):
+                self.window_means[i] = self.window_stats[i].mean
+                self.window_medians[i] = self.window_stats[i].median
+
+            self.stats_history.append(row)
+
+        lines = ["~~~~~~~~~~",
+                 f"Mean Fitness:\t{self.means[0]}",
+                 f"Median Fitness:\t{self.medians[0]}"]
+        if self.window_stats:
+            last = self.window_label()
+            lines.append(f"Mean Fitness (last {last}):\t{self.window_means[0]}")
+            lines.append(f"Median Fitness (last {last}):\t{self.window_medians[0]}")
+        lines.append("~~~~~~~~~~")
+        self.output("\n".join(lines))
+
+    def window_label(self):
+        if self.window_generations:
+            return f"{self.window_generations} generations"
+        return f"{self.window_size} deaths"
 
     def print_stats(self):
         print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
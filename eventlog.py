@@ -0,0 +1,144 @@
+from collections import deque
+
+from settings import (EVENT_LOG_LEVEL, EVENT_LOG_SIZE, EVENT_LOG_BATCH, EVENT_LOG_FILE,
+                      EVENT_LOG_RATE)
+from datastats import info_text
+
+# kinds of events
+MUTATION = 0
+BIRTH = 1
+DEATH = 2
+GENERATION = 3
+RECORD = 4
+KIND_NAMES = ("mutation", "birth", "death", "generation", "record")
+
+LEVELS = {"debug": 10, "info": 20, "record": 30, "off": 100}
+KIND_LEVELS = (LEVELS["debug"], LEVELS["info"], LEVELS["debug"], LEVELS["info"],
+               LEVELS["record"])
+
+
+def format_event(event):
+    ticks, kind, fields = event
+    if kind == MUTATION:
+        cid, i, mutation_range, offset, old, new = fields
+        return (f"[{ticks}] [{cid}] mutating [{i}] (range:{mutation_range}, " +
+                f"offset:{offset}): {old} --> {new}")
+    if kind == BIRTH:
+        cid, parent, gen, chance = fields
+        if chance is None:
+            return f"[{ticks}] [{parent}] breeds [{cid}] (gen {gen})"
+        return f"[{ticks}] [{parent}] breeds with a chance of: {chance}. [{cid}] (gen {gen})"
+    if kind == DEATH:
+        cid, age, fitness = fields
+        return f"[{ticks}] [{cid}] dies at {age} seconds (fitness {fitness})"
+    if kind == GENERATION:
+        gen, size = fields
+        return f"\n~~~~~~~~~ GEN: {gen} ~~~~~~~~~ [{ticks}] (bred from {size} creatures)"
+    old, new = fields
+    lines = ["\n---------------------- New Record --------------------"]
+    if old is not None:
+        lines += ["old:", info_text(old, ticks)]
+    lines += ["new:", info_text(new, ticks),
+              "------------------------------------------------------"]
+    return "\n".join(lines)
+
+
+class EventLog:
+    """ structured log of what happens in a world. Events below the level
+    are dropped at the call site (see enabled) before anything is formatted,
+    the rest wait in a ring buffer as raw tuples and are formatted and
+    written in batches by write(). At most rate events of each kind are kept
+    per simulated second """
+
+    def __init__(self, level=None, size=None, batch=None, path=None, rate=None):
+        # the EVENT_LOG_* settings by default
+        self.buffer = deque(maxlen=EVENT_LOG_SIZE if size is None else size)
+        self.batch = EVENT_LOG_BATCH if batch is None else batch
+        self.path = EVENT_LOG_FILE if path is None else path  # "" writes to the console
+        self.rate = EVENT_LOG_RATE if rate is None else rate
+        self.set_level(EVENT_LOG_LEVEL if level is None else level)
+
+        # simulated time, set by the world every step
+        self.ticks = 0
+        self.second = 0
+        self.counts = [0 for _ in KIND_NAMES]
+
+        # counters
+        self.logged = 0
+        self.suppressed = [0 for _ in KIND_NAMES]  # over the rate, since the last batch
+        self.dropped = 0  # overwritten in the ring before being written
+        self.total_suppressed = 0
+        self.total_dropped = 0
+        self.written = 0
+
+    def set_level(self, level):
+        self.level = level
+        # call sites check enabled[kind] before building the event
+        self.enabled = [LEVELS[level] <= kind_level for kind_level in KIND_LEVELS]
+
+    def add(self, kind, *fields):
+        second = self.ticks // 1000
+        if second != self.second:
+            self.second = second
+            self.counts = [0 for _ in KIND_NAMES]
+        if self.counts[kind] >= self.rate:
+            self.suppressed[kind] += 1
+            self.total_suppressed += 1
+            return
+        self.counts[kind] += 1
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+            self.total_dropped += 1
+        self.buffer.append((self.ticks, kind, fields))
+        self.logged += 1
+
+    def full(self):
+        """ a batch is ready to be written """
+        return len(self.buffer) >= self.batch
+
+    def take(self):
+        """ the pending events (and a note of the suppressed and dropped
+        ones since the last batch), emptying the buffer """
+        events = list(self.buffer)
+        self.buffer.clear()
+        notes = [f"{count} {KIND_NAMES[kind]}" for kind, count in enumerate(self.suppressed)
+                 if count]
+        if notes or self.dropped:
+            events.append((self.ticks, None, (notes, self.dropped)))
+            self.suppressed = [0 for _ in KIND_NAMES]
+            self.dropped = 0
+        return events
+
+    def write(self, events):
+        """ formats and writes a batch of events, from the writer thread
+        if there is one """
+        lines = []
+        for event in events:
+            if event[1] is None:
+                notes, dropped = event[2]
+                lines.append(f"[{event[0]}] event log: " +
+                             f"{', '.join(notes) or 'no'} events over the rate limit, " +
+                             f"{dropped} dropped (buffer full)")
+            else:
+                lines.append(format_event(event))
+        text = "\n".join(lines)
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        self.written += len(events)
+
+    def counters(self):
+        return {
+            "level": self.level,
+            "pending": len(self.buffer),
+            "logged": self.logged,
+            "written": self.written,
+            "suppressed": self.total_suppressed,
+            "dropped": self.total_dropped,
+        }
+
+
+# creatures created outside of a world log nothing
+SILENT = EventLog(level="off")
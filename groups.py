@@ -0,0 +1,34 @@
+""" sets of entities (creatures, foods) of a world, in the order they were
+added so every run goes through them in the same order. They replace the
+pygame sprite groups: an entity doesn't know its groups, the world adds
+and removes it, and drawing is done elsewhere (see sprites.EntitySprites) """
+
+
+class Group:
+    __slots__ = ("entities",)
+
+    def __init__(self):
+        self.entities = {}  # entity: None, a dict keeps the insertion order
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __bool__(self):
+        return bool(self.entities)
+
+    def __contains__(self, entity):
+        return entity in self.entities
+
+    def __iter__(self):
+        # the group can't change while iterating, copy it (list()) to do that
+        return iter(self.entities)
+
+    def add(self, entity):
+        self.entities[entity] = None
+
+    def remove(self, entity):
+        """ removes entity if it's in the group """
+        self.entities.pop(entity, None)
+
+    def clear(self):
+        self.entities.clear()
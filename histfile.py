@@ -0,0 +1,206 @@
+""" binary columnar history files
+
+Layout, every number little endian:
+    b"FCHIST01"                    magic
+    uint32 n, n bytes of json      {"columns": [[name, dtype], ...]}, padded to 8 bytes
+    chunks, appended one after another:
+        b"CHNK", uint32 rows
+        for every column, rows values of its dtype
+
+Every dtype is 8 bytes wide, so all the columns stay aligned and the reader
+returns them as zero-copy views of a memory mapped file.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import struct
+import numpy as np
+
+from settings import HEADER1, HEADER2
+
+MAGIC = b"FCHIST01"
+CHUNK_MAGIC = b"CHNK"
+
+# columns stored as integers, everything else is a float
+INT_COLUMNS = ("Time", "Gen", "Childs", "FoodEaten", "PoisonEaten")
+
+
+def dtype_for(names):
+    """ record dtype of a file with the given column names """
+    return np.dtype([(name, '<i8' if name in INT_COLUMNS else '<f8')
+                     for name in names])
+
+
+HISTORY_DTYPE = dtype_for(HEADER1)
+STATS_DTYPE = dtype_for(HEADER2)
+
+
+def _header(dtype):
+    columns = [[name, dtype[name].str] for name in dtype.names]
+    data = json.dumps({"columns": columns}).encode()
+    data += b" " * (-(len(MAGIC) + 4 + len(data)) % 8)
+    return MAGIC + struct.pack("<I", len(data)) + data
+
+
+def append_records(path, records, fsync=False):
+    """ appends a structured array as a new chunk, creating the file with
+    its header if it doesn't exist """
+    new = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, "ab") as f:
+        if new:
+            f.write(_header(records.dtype))
+        if not len(records):
+            return
+        f.write(CHUNK_MAGIC + struct.pack("<I", len(records)))
+        for name in records.dtype.names:
+            f.write(np.ascontiguousarray(records[name],
+                                         dtype=records.dtype[name].newbyteorder('<')).tobytes())
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class HistoryReader:
+    """ memory maps a binary history file, nothing is parsed or copied
+    until a column is requested """
+
+    def __init__(self, path):
+        self.path = path
+        size = os.path.getsize(path)
+        self.buf = np.memmap(path, dtype=np.uint8, mode="r") if size else b""
+        if bytes(self.buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a binary history file")
+        (length,) = struct.unpack("<I", bytes(self.buf[8:12]))
+        header = json.loads(bytes(self.buf[12:12 + length]))
+        self.dtype = np.dtype([(name, dt) for name, dt in header["columns"]])
+        self.names = self.dtype.names
+
+        # find where each chunk starts
+        self.chunk_offsets = []  # (offset of the first column, rows)
+        offset = 12 + length
+        row_size = self.dtype.itemsize
+        while offset + 8 <= size:
+            if bytes(self.buf[offset:offset + 4]) != CHUNK_MAGIC:
+                raise ValueError(f"{path}: bad chunk at byte {offset}")
+            (rows,) = struct.unpack("<I", bytes(self.buf[offset + 4:offset + 8]))
+            end = offset + 8 + rows * row_size
+            if end > size:
+                # last chunk still being written
+                break
+            self.chunk_offsets.append((offset + 8, rows))
+            offset = end
+
+    def __len__(self):
+        return sum(rows for _, rows in self.chunk_offsets)
+
+    def chunks(self):
+        """ yields a {name: array} dict per chunk, arrays are views of the file """
+        for offset, rows in self.chunk_offsets:
+            chunk = {}
+            for name in self.names:
+                dt = self.dtype[name]
+                chunk[name] = np.frombuffer(self.buf, dtype=dt, count=rows, offset=offset)
+                offset += rows * dt.itemsize
+            yield chunk
+
+    def column(self, name):
+        """ whole column, only a view if the file has one chunk """
+        parts = [chunk[name] for chunk in self.chunks()]
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return np.zeros(0, dtype=self.dtype[name])
+        return np.concatenate(parts)
+
+    def records(self):
+        """ the whole file as a structured array (a copy) """
+        out = np.zeros(len(self), dtype=self.dtype)
+        start = 0
+        for chunk in self.chunks():
+            rows = len(chunk[self.names[0]])
+            for name in self.names:
+                out[name][start:start + rows] = chunk[name]
+            start += rows
+        return out
+
+
+class CsvReader:
+    """ reads a history or stats csv file (as saved by save_csv) chunk_rows
+    lines at a time, with the same chunks() as HistoryReader """
+
+    def __init__(self, path, chunk_rows=65536):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        with open(path, newline="") as f:
+            self.header_line = f.readline()
+        if not self.header_line.strip():
+            raise ValueError(f"{path} is empty")
+        self.dtype = dtype_for(next(csv.reader([self.header_line])))
+        self.names = self.dtype.names
+
+    def chunks(self):
+        """ yields a {name: array} dict per chunk_rows lines, only one chunk
+        is in memory at a time """
+        with open(self.path, newline="") as f:
+            f.readline()
+            while True:
+                lines = list(itertools.islice(f, self.chunk_rows))
+                if not lines:
+                    break
+                # a header written again when a run continues the file
+                lines = [line for line in lines
+                         if line.strip() and line != self.header_line]
+                if not lines:
+                    continue
+                values = np.loadtxt(lines, delimiter=",", ndmin=2)
+                yield {name: values[:, i].astype(self.dtype[name])
+                       for i, name in enumerate(self.names)}
+
+
+def open_history(path, chunk_rows=65536):
+    """ a HistoryReader for binary files, a CsvReader for anything else """
+    with open(path, "rb") as f:
+        binary = f.read(len(MAGIC)) == MAGIC
+    return HistoryReader(path) if binary else CsvReader(path, chunk_rows)
+
+
+def csv_to_bin(csv_path, bin_path, chunk_rows=65536):
+    """ converts a history or stats csv file, reading it in chunks """
+    reader = CsvReader(csv_path, chunk_rows)
+    # the header, even if there are no rows
+    append_records(bin_path, np.zeros(0, dtype=reader.dtype))
+    for chunk in reader.chunks():
+        records = np.zeros(len(chunk[reader.names[0]]), dtype=reader.dtype)
+        for name in reader.names:
+            records[name] = chunk[name]
+        append_records(bin_path, records)
+
+
+def bin_to_csv(bin_path, csv_path):
+    """ writes a binary history file with the same layout as save_csv """
+    reader = HistoryReader(bin_path)
+    with open(csv_path, mode="w", newline="") as f:
+        writer = csv.writer(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(reader.names)
+        for chunk in reader.chunks():
+            columns = [chunk[name].tolist() for name in reader.names]
+            writer.writerows(zip(*columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert history/stats files between csv and binary")
+    parser.add_argument("direction", choices=["tobin", "tocsv"])
+    parser.add_argument("source")
+    parser.add_argument("dest")
+    args = parser.parse_args()
+    if args.direction == "tobin":
+        csv_to_bin(args.source, args.dest)
+    else:
+        bin_to_csv(args.source, args.dest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import contextlib
+import os
+import queue
+from multiprocessing import Process, Queue
+from time import perf_counter
+
+import settings
+from config import Config, apply_overrides, parse_assignments
+from world import World
+from vecworld import VecWorld
+
+TOPOLOGIES = ("ring", "full")
+
+
+def neighbours(index, islands, topology):
+    """ islands that receive the migrants of the given island """
+    if islands == 1:
+        return []
+    if topology == "ring":
+        return [(index + 1) % islands]
+    return [i for i in range(islands) if i != index]
+
+
+def best_genomes(world, count):
+    """ dna of the fittest creatures: the alive ones, the last finished
+    generation (By Gen) and the all times fittest """
+    candidates = list(world.all_creatures) + list(world.ds.temp_hist_by_gen)
+    if world.ds.fittest is not None:
+        candidates.append(world.ds.fittest)
+    # a creature can be in more than one place
+    candidates = list({id(c): c for c in candidates}.values())
+    candidates.sort(key=lambda c: c.fitness(), reverse=True)
+    return [list(c.dna) for c in candidates[:count]]
+
+
+def island(index, spec, inboxes, reports):
+    """ runs the world of one island, sending its best genomes to its
+    neighbours every spec["migrate_every"] generations """
+    apply_overrides(Config(spec.get("overrides")).changes())
+    seed = spec["seed"] + index
+    world_class = VecWorld if spec.get("numpy") else World
+    world = world_class(spawn_mode=spec.get("by_gen", False), save_to_csv=False, seed=seed)
+    world.ds.background_writer = False
+
+    targets = neighbours(index, len(inboxes), spec["topology"])
+    every = spec["migrate_every"]
+    next_migration = every
+    generations = spec.get("generations")
+    end_ticks = None if spec.get("seconds") is None else spec["seconds"] * 1000
+    steps = spec.get("steps")
+    record = 0
+    sent = received = 0
+    start = perf_counter()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        while True:
+            if steps is not None and world.steps >= steps:
+                break
+            if end_ticks is not None and world.ticks >= end_ticks:
+                break
+            if generations is not None and world.generation >= generations:
+                break
+
+            # migrants from the other islands
+            while True:
+                try:
+                    dna = inboxes[index].get_nowait()
+                except queue.Empty:
+                    break
+                received += 1
+                world.immigrants.append(dna)
+            # keep only the newest ones if the world can't place them
+            del world.immigrants[:-settings.TOTAL_CREATURES]
+
+            world.step()
+
+            if world.generation >= next_migration:
+                next_migration = world.generation + every
+                for dna in best_genomes(world, spec["migrants"]):
+                    for target in targets:
+                        inboxes[target].put(dna)
+                        sent += 1
+
+            if world.ds.fitness_record > record:
+                record = world.ds.fitness_record
+                reports.put(("record", index, world.generation, world.ticks,
+                             record, list(world.ds.fittest.dna)))
+
+        world.ds.calc_stats(world.ticks)
+    elapsed = perf_counter() - start
+    world.close()
+
+    reports.put(("done", index, {
+        "island": index,
+        "seed": seed,
+        "steps": world.steps,
+        "sim_seconds": world.ticks / 1000,
+        "steps_per_second": world.steps / max(elapsed, 1e-9),
+        "generation": world.generation,
+        "deaths": len(world.ds.history),
+        "sent": sent,
+        "received": received,
+        "fitness_record": world.ds.fitness_record,
+        "mean_fitness": world.ds.means[0],
+        "median_fitness": world.ds.medians[0],
+        "fittest_dna": list(world.ds.fittest.dna) if world.ds.fittest else None,
+    }))
+    # don't wait for neighbours that already finished to read our migrants
+    for inbox in inboxes:
+        inbox.cancel_join_thread()
+
+
+def run_islands(spec, islands):
+    """ evolves islands populations in parallel processes, returns the
+    summary of every island and the global record (fitness, island, dna) """
+    inboxes = [Queue() for _ in range(islands)]
+    reports = Queue()
+    processes = [Process(target=island, args=(i, spec, inboxes, reports), daemon=True)
+                 for i in range(islands)]
+    for p in processes:
+        p.start()
+
+    summaries = {}
+    best = (0, None, None)
+    while len(summaries) < islands:
+        message = reports.get()
+        if message[0] == "record":
+            _, index, generation, ticks, fitness, dna = message
+            if fitness > best[0]:
+                best = (fitness, index, dna)
+                print(f"[{ticks}] New global record: {fitness:.3f} " +
+                      f"(island {index}, gen {generation})\nDNA: {dna}")
+        else:
+            _, index, summary = message
+            summaries[index] = summary
+            print(f"island {index} done: gen {summary['generation']}, " +
+                  "record {:.3f}, mean fitness {:.3f}".format(
+                      summary["fitness_record"], summary["mean_fitness"]))
+    for p in processes:
+        p.join()
+    return [summaries[i] for i in range(islands)], best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Island model: evolve several populations in parallel " +
+        "processes exchanging their best genomes")
+    parser.add_argument("--islands", type=int, default=os.cpu_count())
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="ring")
+    parser.add_argument("--migrate-every", type=int, default=5,
+                        help="generations between migrations")
+    parser.add_argument("--migrants", type=int, default=2,
+                        help="genomes sent to every neighbour")
+    parser.add_argument("--seed", type=int, default=0, help="island i uses seed + i")
+    parser.add_argument("--steps", type=int, default=None)
+    parser.add_argument("--seconds", type=float, default=None, help="simulated seconds")
+    parser.add_argument("--generations", type=int, default=None)
+    parser.add_argument("--by-gen", action="store_true", help="By Gen spawn mode")
+    parser.add_argument("--numpy", action="store_true", help="use VecWorld")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="override a value of settings.py, can be repeated")
+    args = parser.parse_args()
+    if args.steps is None and args.seconds is None and args.generations is None:
+        parser.error("give a budget with --steps, --seconds and/or --generations")
+
+    overrides = parse_assignments(args.set)
+    spec = {"seed": args.seed, "steps": args.steps, "seconds": args.seconds,
+            "generations": args.generations, "by_gen": args.by_gen,
+            "numpy": args.numpy, "overrides": overrides, "topology": args.topology,
+            "migrate_every": args.migrate_every, "migrants": args.migrants}
+
+    summaries, (fitness, index, dna) = run_islands(spec, args.islands)
+
+    print("\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
+    for s in summaries:
+        print(f"island {s['island']}: gen {s['generation']}, deaths {s['deaths']}, " +
+              f"migrants sent/received {s['sent']}/{s['received']}, " +
+              "record {:.3f}, mean fitness {:.3f}, median fitness {:.3f}".format(
+                  s["fitness_record"], s["mean_fitness"], s["median_fitness"]))
+    print(f"Global record: {fitness:.3f} (island {index})\nDNA: {dna}")
+    print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
+
+
+if __name__ == "__main__":
+    main()
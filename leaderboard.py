@@ -0,0 +1,122 @@
+""" the fittest creatures, kept up to date as they change instead of
+scanning the whole population
+
+Every alive creature ages at the same rate, so the order of their fitness
+(sqrt of age + food_eaten * 2 - poison_eaten) only changes when one of them
+eats, is born or dies. Leaderboard keeps them sorted by
+
+    score = food_eaten * 2 - poison_eaten - birth
+
+where birth is the world clock when the creature had age 0, and only moves
+the creature that changed: a binary search to find and another one to
+insert. The clock and the ages are sums of float dts, so the scores of
+creatures born at different times carry a rounding error that grows with
+the clock: scores closer than REL_TOL times the clock are taken as ties,
+and best() and top() order those by their real fitness, as a full sort
+would. The dead ones are ranked by Datastats (hall_of_fame), this module
+merges both for the p hotkey and the overlay.
+"""
+from bisect import bisect_left, insort
+from itertools import count
+
+from settings import LEADERBOARD_SIZE
+from datastats import creature_info
+
+# relative to the clock, two scores closer than this may be in either order
+REL_TOL = 1e-9
+
+
+def tolerance(clock):
+    return REL_TOL * max(abs(clock), 1.0)
+
+
+class Leaderboard:
+    """ alive creatures of a World sorted from the fittest, ties in spawn order """
+
+    def __init__(self):
+        self.keys = []  # sorted (-score, seq)
+        self.entries = {}  # creature: its key
+        self.creatures = {}  # seq: creature
+        self.seq = count()
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def score(c, clock):
+        return c.food_eaten * 2 - c.poison_eaten - (clock - c.age)
+
+    def add(self, c, clock):
+        key = (-self.score(c, clock), next(self.seq))
+        insort(self.keys, key)
+        self.entries[c] = key
+        self.creatures[key[1]] = c
+
+    def remove(self, c):
+        key = self.entries.pop(c)
+        del self.keys[bisect_left(self.keys, key)]
+        del self.creatures[key[1]]
+
+    def update(self, c, clock):
+        """ c ate something """
+        key = self.entries[c]
+        new_key = (-self.score(c, clock), key[1])
+        if new_key != key:
+            del self.keys[bisect_left(self.keys, key)]
+            insort(self.keys, new_key)
+            self.entries[c] = new_key
+
+    def best(self, clock):
+        """ the fittest creature, the first one spawned on ties. Only the
+        ones within tolerance(clock) of the top score are compared """
+        best = None
+        best_fitness = best_seq = 0
+        limit = self.keys[0][0] + tolerance(clock) if self.keys else 0
+        for neg_score, seq in self.keys:
+            if neg_score > limit:
+                break
+            c = self.creatures[seq]
+            fitness = c.fitness()
+            if (best is None or fitness > best_fitness or
+                    (fitness == best_fitness and seq < best_seq)):
+                best, best_fitness, best_seq = c, fitness, seq
+        return best
+
+    def top(self, k, clock):
+        """ the k fittest creatures, fittest first and in spawn order on
+        ties, the same as sorting all of them by fitness """
+        if k <= 0 or not self.keys:
+            return []
+        # the scores tied with the k-th one may belong before it
+        end = min(k, len(self.keys))
+        limit = self.keys[end - 1][0] + tolerance(clock)
+        while end < len(self.keys) and self.keys[end][0] <= limit:
+            end += 1
+        candidates = [(self.creatures[seq], seq) for _, seq in self.keys[:end]]
+        candidates.sort(key=lambda item: (-item[0].fitness(), item[1]))
+        return [c for c, _ in candidates[:k]]
+
+
+def current_top(world, k=None):
+    """ infos (see creature_info) of the k (LEADERBOARD_SIZE) fittest
+    alive creatures """
+    k = LEADERBOARD_SIZE if k is None else k
+    return [creature_info(c) for c in world.top(k)]
+
+
+def all_time_top(world, k=None):
+    """ infos of the k fittest creatures ever: the hall of fame of the
+    dead ones and the alive ones """
+    k = LEADERBOARD_SIZE if k is None else k
+    infos = [info for _, _, info in world.ds.hall_of_fame] + current_top(world, k)
+    infos.sort(key=lambda info: info["fitness"], reverse=True)
+    return infos[:k]
+
+
+def board_lines(infos):
+    """ text table of a list of infos """
+    lines = [f"{'#':>3} {'fitness':>8} {'age':>7} {'food':>5} {'pois':>5} {'gen':>4}"]
+    for i, info in enumerate(infos):
+        lines.append(f"{i + 1:3} {info['fitness']:8.2f} {info['age']:7.1f} " +
+                     f"{info['food_eaten']:5} {info['poison_eaten']:5} {info['gen']:4}")
+    return lines
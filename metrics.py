@@ -0,0 +1,219 @@
+""" live metrics of a running world over HTTP, for dashboards
+
+    python world.py --seconds 36000 --metrics 8000
+    curl localhost:8000/metrics         # Prometheus text format
+    curl localhost:8000/metrics.json    # JSON
+
+The server is an asyncio loop in a daemon thread. The simulation never
+waits for it: at most every METRICS_INTERVAL (wall) seconds, after a step,
+the world builds a snapshot, a new dict that is never modified afterwards,
+and publishes it by replacing one reference. Requests are answered from the
+last published snapshot, there are no locks in the step.
+"""
+import asyncio
+import json
+import math
+import threading
+from time import perf_counter, time
+
+from settings import METRICS_HOST, METRICS_INTERVAL, HEADER1, DNA_SIZE
+
+# names of the dna values, as in the history columns
+GENES = HEADER1[len(HEADER1) - DNA_SIZE:]
+
+# exported values: (prometheus name, snapshot key, type, help)
+METRICS = (
+    ("fittest_steps_total", "steps", "counter", "Steps simulated"),
+    ("fittest_sim_seconds_total", "sim_seconds", "counter", "Simulated seconds"),
+    ("fittest_steps_per_second", "steps_per_second", "gauge",
+     "Steps simulated per wall second since the previous snapshot"),
+    ("fittest_alive", "alive", "gauge", "Creatures alive"),
+    ("fittest_foods", "foods", "gauge", "Foods in the world"),
+    ("fittest_poisons", "poisons", "gauge", "Poisons in the world"),
+    ("fittest_deaths_total", "deaths", "counter", "Creatures dead"),
+    ("fittest_generation", "generation", "gauge", "Highest generation born"),
+    ("fittest_fitness_record", "fitness_record", "gauge", "Fitness record of all times"),
+    ("fittest_record_age_seconds", "record_age", "gauge", "Age of the record creature"),
+    ("fittest_mean_fitness", "mean_fitness", "gauge", "Mean fitness of the dead creatures"),
+    ("fittest_median_fitness", "median_fitness", "gauge",
+     "Median fitness of the dead creatures"),
+)
+
+
+def snapshot(world, steps_per_second):
+    """ the metrics of the world now, plain values only """
+    ds = world.ds
+    foods, poisons = world.food_counts()
+    fittest = None
+    c = ds.current_fittest
+    if c is not None:
+        fittest = {"fitness": c.fitness(), "age": c.age, "gen": c.gen,
+                   "food_eaten": c.food_eaten, "poison_eaten": c.poison_eaten,
+                   "dna": dict(zip(GENES, c.dna))}
+    return {
+        "time": time(),
+        "seed": world.seed,
+        "backend": type(world).__name__,
+        "spawn_mode": "By Gen" if world.spawn_mode else "Continuous",
+        "steps": world.steps,
+        "sim_seconds": world.ticks / 1000,
+        "steps_per_second": steps_per_second,
+        "alive": len(world.all_creatures),
+        "foods": foods,
+        "poisons": poisons,
+        "deaths": len(ds.history),
+        "generation": world.generation,
+        "fitness_record": ds.fitness_record,
+        "record_age": ds.oldest_age,
+        # running values, calc_stats only refreshes ds.means every SAVE_DELAY
+        "mean_fitness": ds.stream_stats[0].mean,
+        "median_fitness": ds.stream_stats[0].median,
+        "fittest": fittest,
+    }
+
+
+def _number(value):
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+def prometheus_text(snap):
+    """ the snapshot in the Prometheus text exposition format """
+    labels = f'seed="{snap["seed"]}",backend="{snap["backend"]}"'
+    lines = []
+    for name, key, kind, text in METRICS:
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name}{{{labels}}} {_number(snap[key])}")
+    if snap["fittest"] is not None:
+        lines.append("# HELP fittest_current_fitness Fitness of the current fittest creature")
+        lines.append("# TYPE fittest_current_fitness gauge")
+        lines.append(f"fittest_current_fitness{{{labels}}} " +
+                     _number(snap["fittest"]["fitness"]))
+        lines.append("# HELP fittest_current_dna DNA of the current fittest creature")
+        lines.append("# TYPE fittest_current_dna gauge")
+        for gene, value in snap["fittest"]["dna"].items():
+            lines.append(f'fittest_current_dna{{{labels},gene="{gene}"}} ' +
+                         _number(float(value)))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer(threading.Thread):
+    """ serves the last published snapshot on host:port (port 0 picks a
+    free one, see self.port once started) """
+
+    def __init__(self, port, host=None, interval=None):
+        super().__init__(name="MetricsServer", daemon=True)
+        self.host = METRICS_HOST if host is None else host
+        self.port = port
+        self.interval = METRICS_INTERVAL if interval is None else interval
+
+        # published by the simulation thread, only read by the server
+        self.snapshot = None
+        self.last_publish = None
+        self.last_steps = 0
+
+        # counters
+        self.published = 0
+        self.requests = 0
+
+        self.loop = None
+        self.error = None
+        self.ready = threading.Event()
+        self.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            server = self.loop.run_until_complete(
+                asyncio.start_server(self.handle, self.host, self.port))
+        except OSError as e:
+            self.error = e
+            self.loop.close()
+            self.ready.set()
+            return
+        self.port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            server.close()
+            self.loop.run_until_complete(server.wait_closed())
+            self.loop.close()
+
+    def publish(self, world):
+        """ called after every step, takes a snapshot every self.interval seconds """
+        now = perf_counter()
+        if self.last_publish is None:
+            rate = 0
+        else:
+            elapsed = now - self.last_publish
+            if elapsed < self.interval:
+                return
+            rate = (world.steps - self.last_steps) / max(elapsed, 1e-9)
+        # one reference replaced, the server thread sees the old or the new one
+        self.snapshot = snapshot(world, rate)
+        self.last_publish = now
+        self.last_steps = world.steps
+        self.published += 1
+
+    def response(self, method, path):
+        """ status, content type and body of a request """
+        if method not in ("GET", "HEAD"):
+            return "405 Method Not Allowed", "text/plain", "only GET\n"
+        snap = self.snapshot
+        if path not in ("/", "/metrics", "/metrics.json"):
+            return "404 Not Found", "text/plain", "try /metrics or /metrics.json\n"
+        if snap is None:
+            return "503 Service Unavailable", "text/plain", "no snapshot yet\n"
+        if path == "/metrics":
+            return ("200 OK", "text/plain; version=0.0.4; charset=utf-8",
+                    prometheus_text(snap))
+        return "200 OK", "application/json", json.dumps(snap) + "\n"
+
+    async def handle(self, reader, writer):
+        """ one HTTP/1.0 style request per connection """
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # the headers don't matter
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+            parts = request.decode("latin-1").split()
+            method = parts[0] if parts else ""
+            path = parts[1].split("?")[0] if len(parts) > 1 else ""
+            self.requests += 1
+            status, content_type, body = self.response(method, path)
+            body = body.encode()
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+                         .encode())
+            if method != "HEAD":
+                writer.write(body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        """ stops the server and waits for its thread """
+        if self.loop is not None and self.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.join()
+
+
+def start_metrics(world, port, host=None):
+    """ serves the metrics of world while it runs, until world.close() """
+    world.metrics = MetricsServer(port, host)
+    world.metrics.publish(world)
+    return world.metrics
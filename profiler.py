@@ -0,0 +1,101 @@
+import csv
+import json
+from collections import deque
+from time import perf_counter
+
+from settings import PROFILER_WINDOW
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, p):
+    """ nearest rank percentile of an already sorted list """
+    if not sorted_values:
+        return 0
+    rank = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class PhaseProfiler:
+    """ times the phases of a frame: every lap(name) adds the time since the
+    previous lap to that phase, end_frame() closes the frame. The last
+    window frames are kept for the percentiles. While disabled lap() and
+    end_frame() return straight away """
+
+    def __init__(self, window=None, enabled=False):
+        self.enabled = enabled
+        self.frames = deque(maxlen=window or PROFILER_WINDOW)  # {phase: seconds} per frame
+        self.phases = []  # in order of appearance
+        self.frame = {}
+        self.frame_count = 0
+        self.last = perf_counter()
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.frame = {}
+        self.last = perf_counter()
+
+    def lap(self, name):
+        if not self.enabled:
+            return
+        now = perf_counter()
+        self.frame[name] = self.frame.get(name, 0) + now - self.last
+        self.last = now
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        self.lap("other")
+        if self.frame.keys() - self.phases:
+            self.phases.extend(name for name in self.frame if name not in self.phases)
+        self.frames.append(self.frame)
+        self.frame = {}
+        self.frame_count += 1
+
+    def summary(self):
+        """ {phase: {mean, p50, p95, p99, max}} in milliseconds, plus the
+        whole frame as "total" """
+        result = {}
+        for name in self.phases + ["total"]:
+            if name == "total":
+                values = sorted(sum(f.values()) for f in self.frames)
+            else:
+                values = sorted(f.get(name, 0) for f in self.frames)
+            if not values:
+                continue
+            stats = {"mean": sum(values) / len(values) * 1000}
+            for p in PERCENTILES:
+                stats[f"p{p}"] = percentile(values, p) * 1000
+            stats["max"] = values[-1] * 1000
+            result[name] = stats
+        return result
+
+    def lines(self):
+        """ text table of the summary """
+        lines = [f"{'phase':18}" + "".join(f"{'p' + str(p):>8}" for p in PERCENTILES) + "  ms"]
+        for name, stats in self.summary().items():
+            lines.append(f"{name:18}" +
+                         "".join(f"{stats['p' + str(p)]:8.2f}" for p in PERCENTILES))
+        return lines
+
+    def dump(self, path):
+        """ json with the summary and the kept frames, or csv with one row
+        per kept frame (milliseconds per phase) """
+        if path.endswith(".csv"):
+            with open(path, mode='w', newline='') as data_file:
+                data_writer = csv.writer(data_file)
+                data_writer.writerow(["frame"] + self.phases)
+                first = self.frame_count - len(self.frames)
+                for i, frame in enumerate(self.frames):
+                    data_writer.writerow([first + i] +
+                                         [frame.get(name, 0) * 1000 for name in self.phases])
+        else:
+            with open(path, "w") as f:
+                json.dump({
+                    "frames": self.frame_count,
+                    "window": len(self.frames),
+                    "summary_ms": self.summary(),
+                    "phases": self.phases,
+                    "frames_ms": [[frame.get(name, 0) * 1000 for name in self.phases]
+                                  for frame in self.frames],
+                }, f, indent=1)
@@ -0,0 +1,179 @@
+""" recording and exact replay of a run
+
+A record is a small json file with everything a World needs to repeat a
+run step by step: the seed, the backend, the values of settings.py, the
+dt of every step (run-length encoded) and the user toggles with the step
+they happened at. It also keeps a fingerprint of the final state, so a
+replay can tell if it went the same way.
+
+A record is replayed on the engine that recorded it. World and VecWorld
+draw their random numbers from different generators (e.g. the wander
+targets come from rng in World and from np_rng in VecWorld, in batches)
+and add up floats in a different order, so a run never goes the same way
+on the other engine. A record also has to start with the run, a resumed
+run (see checkpoint.py) can't be recorded.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import struct
+import sys
+from time import perf_counter
+
+import settings
+from config import apply_overrides
+from world import World
+from vecworld import VecWorld
+
+FORMAT_VERSION = 1
+BACKENDS = {"World": World, "VecWorld": VecWorld}
+# toggles that change the trajectory, the rest (e.g. saving) are only kept
+# in the record for information
+REPLAYED_EVENTS = ("toggle_spawn_mode",)
+
+
+def _json_value(value):
+    return json.loads(json.dumps(value))
+
+
+def settings_snapshot():
+    """ json friendly values of settings.py """
+    snapshot = {}
+    for name in dir(settings):
+        if not name.isupper() or name == "OUTPUT_PREFIX":
+            continue
+        value = getattr(settings, name)
+        if isinstance(value, (bool, int, float, str, list, tuple)):
+            snapshot[name] = _json_value(value)
+    return snapshot
+
+
+def fingerprint(world):
+    """ summary and hash of the state of a world """
+    digest = hashlib.sha256()
+    digest.update(world.ds.history.records.tobytes())
+    for c in world.all_creatures:
+        digest.update(struct.pack("<5d", c.x, c.y, c.vel_x, c.vel_y, c.health))
+    return {
+        "steps": world.steps,
+        "ticks": world.ticks,
+        "alive": len(world.all_creatures),
+        "deaths": len(world.ds.history),
+        "fitness_record": world.ds.fitness_record,
+        "digest": digest.hexdigest(),
+    }
+
+
+class Recording:
+    """ collects what happens to a world, see World.recording """
+
+    def __init__(self, world):
+        self.seed = world.seed
+        self.backend = type(world).__name__
+        self.spawn_mode = world.spawn_mode
+        self.save_to_csv = world.save_to_csv
+        self.settings = settings_snapshot()
+        self.dts = []  # [[dt, count], ...]
+        self.events = []  # [[step, name], ...]
+
+    def add_step(self, dt):
+        if self.dts and self.dts[-1][0] == dt:
+            self.dts[-1][1] += 1
+        else:
+            self.dts.append([dt, 1])
+
+    def add_event(self, step, name):
+        self.events.append([step, name])
+
+    def to_dict(self, world):
+        return {
+            "version": FORMAT_VERSION,
+            "seed": self.seed,
+            "backend": self.backend,
+            "spawn_mode": self.spawn_mode,
+            "save_to_csv": self.save_to_csv,
+            "settings": self.settings,
+            "dts": self.dts,
+            "events": self.events,
+            "final": fingerprint(world),
+        }
+
+    def save(self, path, world):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(world), f)
+
+
+def start_recording(world):
+    if world.steps:
+        raise ValueError("a record has to start with the run, not at step " +
+                         f"{world.steps} (resumed from a checkpoint?)")
+    world.recording = Recording(world)
+    return world.recording
+
+
+def replay(record):
+    """ runs the world of a record again on its engine, as fast as
+    possible, returns it """
+    current = settings_snapshot()
+    overrides = {name: value for name, value in record["settings"].items()
+                 if current.get(name) != value}
+    previous = apply_overrides(overrides)
+    try:
+        world_class = BACKENDS[record["backend"]]
+        world = world_class(spawn_mode=record["spawn_mode"], save_to_csv=False,
+                            seed=record["seed"])
+        world.ds.background_writer = False
+        events = {}
+        for step, name in record["events"]:
+            if name in REPLAYED_EVENTS:
+                events.setdefault(step, []).append(name)
+        step = 0
+        for dt, count in record["dts"]:
+            for _ in range(count):
+                for name in events.get(step, ()):
+                    getattr(world, name)()
+                world.step(dt)
+                step += 1
+        world.close()
+    finally:
+        apply_overrides(previous)
+    return world
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a recorded run and check it ends in the same state")
+    parser.add_argument("record", help="json file saved with --record")
+    parser.add_argument("--verbose", action="store_true",
+                        help="show the console output of the simulation")
+    args = parser.parse_args()
+
+    with open(args.record) as f:
+        record = json.load(f)
+
+    start = perf_counter()
+    if args.verbose:
+        world = replay(record)
+    else:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            world = replay(record)
+    elapsed = perf_counter() - start
+
+    expected = record["final"]
+    got = fingerprint(world)
+    print(f"{world.steps} steps ({world.ticks / 1000:.1f} simulated seconds) " +
+          f"replayed in {elapsed:.2f} seconds ({world.steps / max(elapsed, 1e-9):.0f} steps/s)")
+    for key in expected:
+        mark = "" if expected[key] == got[key] else "   <-- differs"
+        print(f"{key}:\t{expected[key]}\t{got[key]}{mark}")
+    if got == expected:
+        print("identical")
+    else:
+        print("DIVERGED")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+""" batched selection and breeding of a whole generation (By Gen mode)
+
+Instead of trying random parents one by one until one is lucky, every
+parent of the new generation is picked at once from the fitness of the old
+one and their dna is mutated as a matrix, one row per child:
+
+    roulette     fitness proportional, binary search of uniform numbers in
+                 the cumulative fitness (the same odds as breeding with
+                 the chance of Datastats.calc_fitness_by_gen)
+    sus          stochastic universal sampling, evenly spaced pointers on
+                 the cumulative fitness: the same odds with less variance
+    tournament   the fittest of TOURNAMENT_SIZE random creatures
+"""
+import numpy as np
+
+from settings import *
+
+
+def roulette(fitness, count, rng):
+    cumulative = np.cumsum(fitness)
+    total = cumulative[-1]
+    if total <= 0:
+        return rng.integers(0, len(fitness), count)
+    parents = np.searchsorted(cumulative, rng.random(count) * total, side="right")
+    return np.minimum(parents, len(fitness) - 1)
+
+
+def stochastic_universal(fitness, count, rng):
+    cumulative = np.cumsum(fitness)
+    total = cumulative[-1]
+    if total <= 0:
+        return rng.integers(0, len(fitness), count)
+    pointers = (rng.random() + np.arange(count)) * (total / count)
+    parents = np.minimum(np.searchsorted(cumulative, pointers, side="right"), len(fitness) - 1)
+    # the pointers pick the parents in order, shuffle them
+    return rng.permutation(parents)
+
+
+def tournament(fitness, count, rng, size=None):
+    if size is None:
+        size = TOURNAMENT_SIZE
+    contestants = rng.integers(0, len(fitness), (count, size))
+    winners = np.argmax(fitness[contestants], axis=1)
+    return contestants[np.arange(count), winners]
+
+
+SELECTIONS = {"roulette": roulette, "sus": stochastic_universal, "tournament": tournament}
+
+
+def mutation_ranges(fitness):
+    """ range in which the dna of a creature can mutate, see Creature.mutate """
+    return MAX_MUTATION_VALUE / ((fitness * 0.1) ** 2 + 1)
+
+
+def mutate(dna, fitness, rng):
+    """ Creature.mutate of every row of dna, fitness being the one of the
+    parent of each row. Returns the mutated dna and the mask of the
+    mutated genes """
+    mask = rng.random(dna.shape) < MUTATION_CHANCE
+    ranges = mutation_ranges(fitness)[:, None]
+    offsets = (rng.random(dna.shape) * 2 - 1) * ranges
+    return np.clip(np.where(mask, dna + offsets, dna), 0, 1), mask
+
+
+def breed(dna, fitness, count, rng, method=None):
+    """ dna and fitness of the old generation (one row each), returns the
+    row of the parent, the mutated dna and the mask of mutated genes of
+    count children. method defaults to SELECTION """
+    parents = SELECTIONS[method or SELECTION](fitness, count, rng)
+    children, mask = mutate(dna[parents], fitness[parents], rng)
+    return parents, children, mask
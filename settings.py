@@ -3,14 +3,84 @@ from time import time
 ### CONFIGURATION ###
 WIN_WIDTH = 1280
 WIN_HEIGHT = 860
+# size of the simulated world, it can be many times the window, which shows
+# the part of it under the camera (camera.py)
+WORLD_WIDTH = WIN_WIDTH
+WORLD_HEIGHT = WIN_HEIGHT
+# camera: window pixels panned per frame with the arrow keys, zoom factor of
+# a mouse wheel step and the closest zoom (the farthest shows the whole world)
+CAMERA_PAN_STEP = 20
+CAMERA_ZOOM_STEP = 1.25
+CAMERA_MAX_ZOOM = 4
 FPS = 40
+# simulated seconds advanced by each step of the world, the window (and a
+# headless world, see world.py) always steps the simulation by SIM_DT
+SIM_DT = 1 / FPS
+# steps simulated per rendered frame at most, if the machine can't keep up
+# the simulation slows down instead of taking bigger steps
+MAX_SUBSTEPS = 8
+# turbo mode (t hotkey) simulates as fast as possible and draws a frame
+# (or only updates the caption) every TURBO_RENDER_EVERY steps
+TURBO_RENDER_EVERY = 100
 BACKGROUND_COLOR = (7, 7, 7)
 FOOD_COLOR = (50, 50, 255)
 POISON_COLOR = (255, 50, 50)
+# creature images are pre-rendered (sprites.py) for SPRITE_COLOR_STEPS health
+# colors and SPRITE_ANGLE_STEPS headings, keeping at most SPRITE_CACHE_BYTES
+SPRITE_COLOR_STEPS = 32
+SPRITE_ANGLE_STEPS = 72  # 5 degrees
+SPRITE_CACHE_BYTES = 32 * 1024 * 1024
 
 SAVE_TO_CSV = False
-STARTTIME = str(int(time()))  # used to save csv with unique name
+# format of the saved history and stats: "csv", "bin" (histfile.py) or "both"
+SAVE_FORMAT = "csv"
+# prefix of the files a run saves (history, stats, checkpoints, profile...),
+# if empty every run uses the time it started, see run_prefix()
+OUTPUT_PREFIX = ""
 SAVE_DELAY = 20 * 1000  # in milliseconds
+# saves and periodic stats are written by a background thread (writer.py),
+# the simulation blocks only if WRITER_QUEUE_SIZE batches are pending
+BACKGROUND_WRITER = True
+WRITER_QUEUE_SIZE = 8
+WRITER_FSYNC = True  # fsync the files after every batch
+# event log (eventlog.py): mutations and deaths are "debug", births and
+# generations "info", new records "record". Events under EVENT_LOG_LEVEL
+# ("off" for none) are skipped before any formatting, the rest are kept in a
+# ring of EVENT_LOG_SIZE and written every EVENT_LOG_BATCH events (and with
+# the stats) to EVENT_LOG_FILE ("": console), at most EVENT_LOG_RATE events
+# of each kind per simulated second
+EVENT_LOG_LEVEL = "info"
+EVENT_LOG_SIZE = 4096
+EVENT_LOG_BATCH = 256
+EVENT_LOG_FILE = ""
+EVENT_LOG_RATE = 20
+# live metrics server (see metrics.py, --metrics PORT): listen address and
+# wall seconds between the snapshots the simulation publishes
+METRICS_HOST = "127.0.0.1"
+METRICS_INTERVAL = 1.0
+# frames kept by the phase profiler (f hotkey, see profiler.py) for its percentiles
+PROFILER_WINDOW = 600
+# if > 0, the world is checkpointed every CHECKPOINT_DELAY milliseconds of
+# simulated time to "<prefix>_checkpoint.ckpt" (see checkpoint.py)
+CHECKPOINT_DELAY = 0
+# spawn positions (see spawner.py): rounds of SPAWN_OVERSAMPLE random points
+# per position wanted, at most SPAWN_ROUNDS rounds per call
+SPAWN_ROUNDS = 4
+SPAWN_OVERSAMPLE = 4
+# foods and poisons added per step (each) while there are less than
+# TOTAL_FOOD / TOTAL_POISON, 0: all the missing ones at once
+SPAWN_FOOD_PER_STEP = 1
+# how By Gen mode picks the parents of a generation (see selection.py):
+# "roulette", "sus" (stochastic universal sampling) or "tournament"
+SELECTION = "roulette"
+TOURNAMENT_SIZE = 3
+# creatures in the leaderboards (p hotkey, l overlay, see leaderboard.py)
+LEADERBOARD_SIZE = 10
+# if > 0, stats also keep the mean and median of the last STATS_WINDOW deaths,
+# or of the deaths of the last STATS_WINDOW_GENERATIONS generations (the
+# newest generation that died and the ones before it) if that one is > 0
+STATS_WINDOW = 0
+STATS_WINDOW_GENERATIONS = 0
 
 HEADER1 = ["Time", "Fitness", "Age", "Gen", "Childs", "FoodEaten", "PoisonEaten",
            "MaxVel_MaxHP", "FoodAttraction", "PoisonAttraction",
@@ -58,6 +128,10 @@ HEALTH_DEGENERATION = 12.3  # creatures will lose hp per second
 POISON_VALUE = -52  # negative value as poison is bad!
 FOOD_VALUE = 20
 
+# side of the cells of the spatial index used for perception, spawning and
+# collisions (spatial.py), queries go up to MAX_PERCEPTION_DIST
+SPATIAL_CELL_SIZE = 75
+
 # Values that will vary according to DNA changes, but have a max value
 MAX_STEER_FORCE = 4
 MAX_PERCEPTION_DIST = 300  # max dist at which creatures can evolve to see food & poison
@@ -73,6 +147,12 @@ MIN_HP = 30
 
 # When the creature finds no food or poison, it wanders
 # wander ring properties:
-WANDER_RING_DISTANCE = (WIN_WIDTH + WIN_HEIGHT) // 8
-WANDER_RING_RADIUS = (WIN_WIDTH + WIN_HEIGHT) // 4
+WANDER_RING_DISTANCE = (WORLD_WIDTH + WORLD_HEIGHT) // 8
+WANDER_RING_RADIUS = (WORLD_WIDTH + WORLD_HEIGHT) // 4
 WANDER_RING_WAIT = 2000
+
+
+def run_prefix():
+    """ OUTPUT_PREFIX, or the current time so every run saves to unique names.
+    Called when a run starts, not at import """
+    return OUTPUT_PREFIX or str(int(time()))
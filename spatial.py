@@ -0,0 +1,145 @@
+from math import floor
+import numpy as np
+
+
+class SpatialHash:
+    """ uniform grid of square cells, maps each cell to the objects inside.
+    Objects must have x and y attributes, the index only stores their cell so
+    it has to be told when they move (move) or leave the world (remove) """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        # cell -> {obj: None}, dicts keep insertion order (deterministic)
+        self.cells = {}
+        self.where = {}  # obj -> cell
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, obj):
+        return obj in self.where
+
+    def cell(self, x, y):
+        return (floor(x / self.cell_size), floor(y / self.cell_size))
+
+    def insert(self, obj):
+        key = self.cell(obj.x, obj.y)
+        self.where[obj] = key
+        self.cells.setdefault(key, {})[obj] = None
+
+    def remove(self, obj):
+        key = self.where.pop(obj, None)
+        if key is None:
+            return
+        cell = self.cells[key]
+        del cell[obj]
+        if not cell:
+            del self.cells[key]
+
+    def move(self, obj):
+        """ updates the cell of obj after it moved """
+        key = self.cell(obj.x, obj.y)
+        old = self.where[obj]
+        if key != old:
+            cell = self.cells[old]
+            del cell[obj]
+            if not cell:
+                del self.cells[old]
+            self.where[obj] = key
+            self.cells.setdefault(key, {})[obj] = None
+
+    def nearby(self, x, y, radius):
+        """ objects in the cells touched by the circle, a superset of the
+        objects closer than radius """
+        x0, y0 = self.cell(x - radius, y - radius)
+        x1, y1 = self.cell(x + radius, y + radius)
+        cells = self.cells
+        found = []
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                cell = cells.get((cx, cy))
+                if cell:
+                    found.extend(cell)
+        return found
+
+    def any_within(self, pos, dist):
+        """ true if an object is strictly closer than dist to pos """
+        dist_sq = dist * dist
+        x, y = pos[0], pos[1]
+        for obj in self.nearby(x, y, dist):
+            dx = obj.x - x
+            dy = obj.y - y
+            if dx * dx + dy * dy < dist_sq:
+                return True
+        return False
+
+
+# below this number of query x point pairs, pairs() checks all of them
+DENSE_PAIRS = 1 << 14
+
+# cell coordinates are packed in one int64 key: (cx + OFFSET) * STRIDE + cy + OFFSET
+_OFFSET = 1 << 24
+_STRIDE = 1 << 26
+
+
+class PointGrid:
+    """ numpy snapshot of points binned in a uniform grid (points sorted by
+    cell), answers radius queries for many query points at once. Rebuilding
+    it is O(n log n) in numpy, so it is rebuilt when the points change
+    instead of being updated point by point """
+
+    def __init__(self, points, cell_size):
+        self.cell_size = cell_size
+        self.points = points
+        cells = np.floor(points / cell_size).astype(np.int64)
+        keys = (cells[:, 0] + _OFFSET) * _STRIDE + cells[:, 1] + _OFFSET
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def pairs(self, queries, radii):
+        """ returns (query index, point index, dx, dy, dist) of every pair
+        closer than or at the radius of its query, dx/dy go from the query
+        to the point """
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                 np.zeros(0), np.zeros(0), np.zeros(0))
+        if not len(queries) or not len(self.keys):
+            return empty
+        radii = np.broadcast_to(radii, (len(queries),))
+        if len(queries) * len(self.keys) <= DENSE_PAIRS:
+            # small worlds: checking every pair is cheaper than the grid
+            q = np.repeat(np.arange(len(queries)), len(self.keys))
+            p = np.tile(np.arange(len(self.keys)), len(queries))
+        else:
+            q, p = self.candidates(queries, radii)
+        dx = self.points[p, 0] - queries[q, 0]
+        dy = self.points[p, 1] - queries[q, 1]
+        dist = np.hypot(dx, dy)
+        keep = dist <= radii[q]
+        return q[keep], p[keep], dx[keep], dy[keep], dist[keep]
+
+    def candidates(self, queries, radii):
+        """ (query index, point index) of the points in the cells touched
+        by the radius of each query """
+        cells = np.floor(queries / self.cell_size).astype(np.int64)
+        reach = np.ceil(radii / self.cell_size).astype(np.int64)
+        max_reach = int(reach.max())
+        span = np.arange(-max_reach, max_reach + 1)
+        ox = np.repeat(span, len(span))
+        oy = np.tile(span, len(span))
+        # keys of every (query, cell offset), only where the radius of the
+        # query reaches that cell
+        rows, offset = np.nonzero(reach[:, None] >= np.maximum(abs(ox), abs(oy))[None, :])
+        keys = (cells[rows, 0] + ox[offset] + _OFFSET) * _STRIDE + \
+            cells[rows, 1] + oy[offset] + _OFFSET
+        lo = np.searchsorted(self.keys, keys, 'left')
+        hi = np.searchsorted(self.keys, keys, 'right')
+        counts = hi - lo
+        total = int(counts.sum())
+        # expand each [lo, hi) range into point indices
+        starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+        return np.repeat(rows, counts), self.order[starts + np.arange(total)]
+
+    def any_within(self, pos, dist):
+        """ true if a point is strictly closer than dist to pos """
+        q, _, _, _, d = self.pairs(np.array([pos], dtype=np.float64), dist)
+        return bool((d < dist).any())
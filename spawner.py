@@ -0,0 +1,67 @@
+""" free positions to spawn creatures and foods
+
+Spawning used to try one random point at a time and give up (until the
+next frame) when it was too close to something. free_positions() throws
+batches of random points instead, drops the ones blocked by the sprites
+already in the world with one batched check, and keeps the rest that are at
+least dist apart from each other. Those are tracked in an occupancy grid of
+dist / sqrt(2) cells, that can hold one point each (as in Poisson disk
+sampling), so a new point only looks at the 5x5 cells around it.
+
+A call throws at most count * SPAWN_OVERSAMPLE points in each of its
+SPAWN_ROUNDS rounds: in a crowded world it returns fewer positions, it
+never takes longer.
+"""
+from math import floor, sqrt
+import numpy as np
+
+from settings import *
+
+
+def random_points(count, rng):
+    """ count random integer positions inside the world, as rows x, y """
+    return np.column_stack((rng.integers(0, int(WORLD_WIDTH), count, endpoint=True),
+                            rng.integers(0, int(WORLD_HEIGHT), count, endpoint=True))
+                           ).astype(np.float64)
+
+
+def free_positions(count, blocked, rng, dist=None, rounds=None, oversample=None):
+    """ up to count positions (rows x, y) where blocked(points), the mask of
+    the points too close to what is already in the world, is false, at
+    least dist (default DISTANCE_BETWEEN_SPRITES) apart from each other """
+    dist = DISTANCE_BETWEEN_SPRITES if dist is None else dist
+    rounds = SPAWN_ROUNDS if rounds is None else rounds
+    oversample = SPAWN_OVERSAMPLE if oversample is None else oversample
+    found = []
+    cell_size = dist / sqrt(2)
+    grid = {}  # cell: the point in it
+    for _ in range(rounds):
+        need = count - len(found)
+        if need <= 0:
+            break
+        points = random_points(need * oversample, rng)
+        points = points[~blocked(points)]
+        for x, y in points.tolist():
+            if dist > 0:
+                cx, cy = floor(x / cell_size), floor(y / cell_size)
+                if _near(grid, cx, cy, x, y, dist):
+                    continue
+                grid[(cx, cy)] = (x, y)
+            found.append((x, y))
+            if len(found) == count:
+                break
+    return np.array(found, dtype=np.float64).reshape(-1, 2)
+
+
+def _near(grid, cx, cy, x, y, dist):
+    """ true if a point of the grid is strictly closer than dist to x, y """
+    dist_sq = dist * dist
+    for i in range(cx - 2, cx + 3):
+        for j in range(cy - 2, cy + 3):
+            point = grid.get((i, j))
+            if point is not None:
+                dx = point[0] - x
+                dy = point[1] - y
+                if dx * dx + dy * dy < dist_sq:
+                    return True
+    return False
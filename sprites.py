@@ -0,0 +1,204 @@
+from collections import OrderedDict
+import pygame as pg
+import pygame.gfxdraw
+
+from settings import *
+from vector import length, angle_of
+
+
+def render_creature(size, green, angle):
+    """ draws a creature of the given size and health color (0 - 255)
+    heading to angle (degrees) """
+    red = 255 - green
+    radius = (size - 1) // 2
+    eye_radius = radius // 3
+
+    image = pg.Surface((size, size), pg.SRCALPHA)
+    pg.gfxdraw.filled_circle(image, radius, radius, radius, (red, green, 35))
+    pg.gfxdraw.filled_circle(image, size - eye_radius,
+                             abs(radius - eye_radius - 2), abs(eye_radius - 2), (red, red, green))
+    pg.gfxdraw.filled_circle(image, size - eye_radius,
+                             radius + eye_radius + 2, abs(eye_radius - 2), (red, red, green))
+    # transform with the negative angle
+    return pg.transform.rotate(image, -angle)
+
+
+def render_food(size, color):
+    radius = (size - 1) // 2
+    image = pg.Surface((size, size), pg.SRCALPHA)
+    pg.gfxdraw.filled_circle(image, radius, radius, radius, color)
+    return image
+
+
+class SpriteCache:
+    """ pre-rendered creature images keyed by (size, health color step, angle
+    step), the least recently used are dropped when they take more than
+    max_bytes. Food and poison share one image per size """
+
+    def __init__(self, color_steps=None, angle_steps=None, max_bytes=None):
+        # the SPRITE_* settings by default
+        self.color_steps = color_steps or SPRITE_COLOR_STEPS
+        self.angle_steps = angle_steps or SPRITE_ANGLE_STEPS
+        self.max_bytes = SPRITE_CACHE_BYTES if max_bytes is None else max_bytes
+
+        self.creatures = OrderedDict()
+        self.foods = {}
+        self.bytes = 0
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def creature(self, size, health, max_health, angle):
+        """ image of a creature, health is clamped to [0, max_health] """
+        color = round(health / max_health * (self.color_steps - 1))
+        color = max(0, min(color, self.color_steps - 1))
+        heading = round(angle * self.angle_steps / 360) % self.angle_steps
+        key = (size, color, heading)
+
+        image = self.creatures.get(key)
+        if image is not None:
+            self.hits += 1
+            self.creatures.move_to_end(key)
+            return image
+
+        self.misses += 1
+        image = render_creature(size, round(color * 255 / (self.color_steps - 1)),
+                                heading * 360 / self.angle_steps)
+        self.creatures[key] = image
+        self.bytes += image.get_bytesize() * image.get_width() * image.get_height()
+        # always keep the newest one
+        while self.bytes > self.max_bytes and len(self.creatures) > 1:
+            _, old = self.creatures.popitem(last=False)
+            self.bytes -= old.get_bytesize() * old.get_width() * old.get_height()
+            self.evictions += 1
+        return image
+
+    def food(self, size, is_poison):
+        key = (size, is_poison)
+        image = self.foods.get(key)
+        if image is None:
+            image = render_food(size, POISON_COLOR if is_poison else FOOD_COLOR)
+            self.foods[key] = image
+        return image
+
+    def counters(self):
+        lookups = self.hits + self.misses
+        return {
+            "sprites": len(self.creatures),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+            "evictions": self.evictions,
+        }
+
+    def print_counters(self):
+        print("~~~~~~~~~~ sprites ~~~~~~~~~~")
+        for name, value in self.counters().items():
+            print(f"{name}:\t{value}")
+        print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
+
+
+# shared by every creature and food, made on first use (see shared_cache)
+SPRITES = None
+
+
+def shared_cache():
+    global SPRITES
+    if SPRITES is None:
+        SPRITES = SpriteCache()
+    return SPRITES
+
+
+class EntitySprites:
+    """ the pygame side of the entities of a world, only created by the
+    renderer: images from the sprite cache at the window positions of the
+    creatures and foods seen by the camera (camera.Camera). Only what
+    intersects the view gets an image, a hidden creature costs a bounds
+    check. Foods don't move, their rects are kept while the camera stays """
+
+    def __init__(self, cache=None):
+        self.cache = cache or shared_cache()
+        self.foods = {}  # visible food: (image, rect)
+        self.view = None  # camera.view() the food rects were made for
+
+    def scaled(self, size, camera):
+        """ size in window pixels, at least 3 so it's still a dot """
+        if camera.zoom == 1:
+            return size
+        return max(3, round(size * camera.zoom))
+
+    def creature(self, c, camera):
+        """ (image, rect) of a creature, for its health and where it's going """
+        image = self.cache.creature(self.scaled(c.size, camera), c.health, c.max_health,
+                                    angle_of(c.vel_x, c.vel_y))
+        return image, image.get_rect(center=camera.to_screen(c.x, c.y))
+
+    def food(self, f, camera):
+        image = self.cache.food(self.scaled(f.size, camera), f.is_poison)
+        return image, image.get_rect(center=camera.to_screen(f.x, f.y))
+
+    def blits(self, world, camera):
+        """ (image, rect) of every food and creature of the world in the
+        view of the camera, for Surface.blits, the creatures on top """
+        view = camera.view()
+        if view != self.view:
+            self.view = view
+            self.foods = {}
+        # no entity is bigger than MAX_CREATURE_SIZE, a circle centered
+        # that far out of the view can't be seen
+        left, top, right, bottom = camera.bounds(MAX_CREATURE_SIZE)
+
+        # the eaten foods are forgotten
+        kept = self.foods
+        self.foods = {}
+        for f in world.all_foods:
+            sprite = kept.get(f)
+            if sprite is None:
+                if not (left <= f.x <= right and top <= f.y <= bottom):
+                    continue
+                sprite = self.food(f, camera)
+            self.foods[f] = sprite
+
+        sprites = list(self.foods.values())
+        for c in world.all_creatures:
+            x, y = c.x, c.y
+            if left <= x <= right and top <= y <= bottom:
+                sprites.append(self.creature(c, camera))
+        return sprites
+
+    def draw_vectors(self, screen, c, options, camera):
+        """ perception and attraction (options[0]), velocity and desired
+        velocity (options[1]) of a creature """
+        zoom = camera.zoom
+        scale = 2 * zoom
+        x, y = camera.to_screen(c.x, c.y)
+        pos = (x, y)
+
+        if options[0]:
+            # food distance
+            pg.draw.circle(screen, FOOD_COLOR, (int(x), int(y)), int(c.food_dist * zoom), 1)
+            # poison distance
+            pg.draw.circle(screen, POISON_COLOR, (int(x), int(y)), int(c.poison_dist * zoom), 1)
+
+            # food / poison attraction
+            speed = length(c.vel_x, c.vel_y)
+            dir_x, dir_y = c.vel_x, c.vel_y
+            if speed:
+                dir_x, dir_y = dir_x / speed, dir_y / speed
+            pg.draw.line(screen, FOOD_COLOR, pos,
+                         (x + dir_x * c.food_attraction * scale,
+                          y + dir_y * c.food_attraction * scale), 2)
+            pg.draw.line(screen, POISON_COLOR, pos,
+                         (x + dir_x * c.poison_attraction * scale,
+                          y + dir_y * c.poison_attraction * scale), 2)
+
+        if options[1]:
+            # vel
+            pg.draw.line(screen, (244, 238, 66), pos,
+                         (x + c.vel_x * zoom, y + c.vel_y * zoom), 4)
+            # desired
+            pg.draw.line(screen, pg.Color('orange'), pos,
+                         (x + c.desired_x * zoom, y + c.desired_y * zoom), 4)
@@ -0,0 +1,230 @@
+""" search of the settings that evolve the fittest creatures
+
+    python sweep.py --grid MUTATION_CHANCE=0.05,0.1,0.2 --grid BREED_CHANCE_VALUE=400,850
+    python sweep.py --random MAX_MUTATION_VALUE=0.05:0.5 --random FOOD_VALUE=10:40 --samples 27
+
+Every configuration (a Config, see config.py) runs headless worlds, one per
+seed, in a process pool. They are ranked by the mean fitness of their dead
+creatures (Datastats.means) and pruned with successive halving: all of them
+run min_seconds simulated seconds, the best 1/eta keep running eta times
+longer, and so on up to max_seconds. Worlds are not started again in the
+next round, they continue from a checkpoint (checkpoint.capture) of where
+they were. The ranked table is saved as csv.
+"""
+import argparse
+import contextlib
+import csv
+import itertools
+import os
+import random
+from multiprocessing import Pool
+from time import perf_counter
+import numpy as np
+
+import settings
+from config import Config, parse_value, parse_assignments
+from checkpoint import capture, restore
+from world import World
+from vecworld import VecWorld
+
+
+def grid_space(grid):
+    """ every combination of {NAME: [values]} """
+    names = list(grid)
+    return [Config(dict(zip(names, values)))
+            for values in itertools.product(*(grid[name] for name in names))]
+
+
+def random_space(grid, ranges, samples, seed):
+    """ samples configurations: a value of the list for the names in grid,
+    uniform in [low, high] for the names in ranges (integers if both are) """
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(samples):
+        values = {name: rng.choice(choices) for name, choices in grid.items()}
+        for name, (low, high) in ranges.items():
+            if isinstance(low, int) and isinstance(high, int):
+                values[name] = rng.randint(low, high)
+            else:
+                values[name] = rng.uniform(low, high)
+        configs.append(Config(values))
+    return configs
+
+
+def run_trial(task):
+    """ runs (or continues) the world of a configuration and seed until
+    task["seconds"] simulated seconds, returns its score and state """
+    with task["config"].applied():
+        world_class = VecWorld if task["numpy"] else World
+        world = world_class(spawn_mode=task["by_gen"], save_to_csv=False, seed=task["seed"])
+        world.ds.background_writer = False
+        world.log.set_level("off")
+        if task["state"] is not None:
+            restore(world, task["state"])
+
+        start = perf_counter()
+        # workers keep quiet, the console is for the parent
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            steps = world.run(seconds=task["seconds"] - world.ticks / 1000)
+            world.ds.calc_stats(world.ticks)
+        elapsed = perf_counter() - start
+        state = capture(world)
+        state["output_sizes"] = {}
+        world.close()
+
+    return {
+        "index": task["index"],
+        "seed": task["seed"],
+        "mean_fitness": world.ds.means[0],
+        "fitness_record": world.ds.fitness_record,
+        "deaths": len(world.ds.history),
+        "generation": world.generation,
+        "steps": steps,
+        "wall_seconds": elapsed,
+        "state": state,
+    }
+
+
+def successive_halving(configs, seeds, min_seconds, max_seconds, eta, by_gen=False,
+                       numpy=False, processes=None):
+    """ returns a row per configuration (its scores in the last round it
+    ran), best first """
+    rows = [{"config": config, "round": 0, "sim_seconds": 0, "mean_fitness": 0,
+             "std_fitness": 0, "fitness_record": 0, "steps": 0, "wall_seconds": 0}
+            for config in configs]
+    states = {}  # (index, seed): state of the world
+    alive = list(range(len(configs)))
+    seconds = min_seconds
+    n_round = 0
+    with Pool(processes) as pool:
+        while alive:
+            n_round += 1
+            tasks = [{"index": i, "config": configs[i], "seed": seed, "seconds": seconds,
+                      "state": states.pop((i, seed), None), "by_gen": by_gen,
+                      "numpy": numpy}
+                     for i in alive for seed in seeds]
+            results = {}
+            for result in pool.imap_unordered(run_trial, tasks):
+                states[(result["index"], result["seed"])] = result.pop("state")
+                results.setdefault(result["index"], []).append(result)
+
+            for i in alive:
+                fitness = [r["mean_fitness"] for r in results[i]]
+                row = rows[i]
+                row.update(round=n_round, sim_seconds=seconds,
+                           mean_fitness=float(np.mean(fitness)),
+                           std_fitness=float(np.std(fitness)),
+                           fitness_record=max(r["fitness_record"] for r in results[i]))
+                row["steps"] += sum(r["steps"] for r in results[i])
+                row["wall_seconds"] += sum(r["wall_seconds"] for r in results[i])
+            alive.sort(key=lambda i: rows[i]["mean_fitness"], reverse=True)
+            print(f"round {n_round}: {len(alive)} configurations x {len(seeds)} seeds " +
+                  f"to {seconds:g} simulated seconds, best mean fitness " +
+                  "{:.3f} ({})".format(rows[alive[0]]["mean_fitness"],
+                                       configs[alive[0]].label() or "defaults"), flush=True)
+
+            if seconds >= max_seconds or len(alive) == 1:
+                break
+            # the pruned ones won't continue, forget their worlds
+            keep = max(1, len(alive) // eta)
+            for i in alive[keep:]:
+                for seed in seeds:
+                    states.pop((i, seed), None)
+            alive = alive[:keep]
+            seconds = min(seconds * eta, max_seconds)
+
+    rows.sort(key=lambda row: (row["round"], row["mean_fitness"]), reverse=True)
+    return rows
+
+
+def save_table(rows, path):
+    """ one row per configuration, a column per swept setting """
+    names = []
+    for row in rows:
+        names.extend(name for name in row["config"].overrides if name not in names)
+    fields = ["rank"] + names + ["round", "sim_seconds", "mean_fitness", "std_fitness",
+                                 "fitness_record", "steps", "wall_seconds"]
+    with open(path, mode='w', newline='') as data_file:
+        data_writer = csv.DictWriter(data_file, fieldnames=fields)
+        data_writer.writeheader()
+        for rank, row in enumerate(rows, 1):
+            values = {name: row["config"].overrides.get(name, "") for name in names}
+            data_writer.writerow({"rank": rank, **values,
+                                  **{f: row[f] for f in fields[len(names) + 1:]}})
+
+
+def parse_space(items, ranges=False):
+    """ NAME=V1,V2,... (or NAME=LOW:HIGH if ranges) """
+    space = {}
+    for item in items:
+        name, _, text = item.partition("=")
+        if ranges:
+            low, _, high = text.partition(":")
+            space[name] = (parse_value(low), parse_value(high))
+        else:
+            space[name] = [parse_value(value) for value in text.split(",")]
+    return space
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Search the settings that evolve the fittest creatures")
+    parser.add_argument("--grid", action="append", default=[], metavar="NAME=V1,V2,...",
+                        help="values to try for a setting, can be repeated")
+    parser.add_argument("--random", action="append", default=[], metavar="NAME=LOW:HIGH",
+                        help="range to sample a setting from (needs --samples)")
+    parser.add_argument("--samples", type=int, default=None,
+                        help="random search: number of configurations")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="fixed value of a setting for every configuration")
+    parser.add_argument("--seeds", type=int, default=2, help="worlds per configuration")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="first seed of the worlds and seed of the random search")
+    parser.add_argument("--min-seconds", type=float, default=60,
+                        help="simulated seconds of the first round")
+    parser.add_argument("--max-seconds", type=float, default=540,
+                        help="simulated seconds of the last round")
+    parser.add_argument("--eta", type=int, default=3,
+                        help="1/eta of the configurations run eta times longer each round")
+    parser.add_argument("--by-gen", action="store_true", help="By Gen spawn mode")
+    parser.add_argument("--numpy", action="store_true", help="use VecWorld")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument("--out", default=None,
+                        help="ranked results table (default: <start time>_sweep.csv)")
+    args = parser.parse_args()
+    if args.eta < 2:
+        parser.error("--eta must be at least 2")
+
+    grid = parse_space(args.grid)
+    ranges = parse_space(args.random, ranges=True)
+    try:
+        fixed = Config(parse_assignments(args.set))
+        if args.samples:
+            configs = random_space(grid, ranges, args.samples, args.seed)
+        elif ranges:
+            parser.error("--random needs --samples")
+        else:
+            configs = grid_space(grid)
+    except ValueError as e:
+        parser.error(str(e))
+    configs = list(dict.fromkeys(fixed.merged(c.overrides) for c in configs))
+
+    if args.out is None:
+        args.out = settings.run_prefix() + "_sweep.csv"
+    seeds = [args.seed + i for i in range(args.seeds)]
+    start = perf_counter()
+    rows = successive_halving(configs, seeds, args.min_seconds, args.max_seconds, args.eta,
+                              args.by_gen, args.numpy, args.processes)
+    elapsed = perf_counter() - start
+    save_table(rows, args.out)
+
+    print(f"\n{len(configs)} configurations in {elapsed:.1f} seconds, results in {args.out}")
+    for rank, row in enumerate(rows[:10], 1):
+        print("{:3} {:8.3f} +- {:.3f} ({:g} s)  {}".format(
+            rank, row["mean_fitness"], row["std_fitness"], row["sim_seconds"],
+            row["config"].label() or "defaults"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+""" 2d vector math on plain floats, for the entities that keep their x, y
+as separate fields. The operations are done in the same order as
+pygame.math.Vector2 does them, so the results are the same to the last bit
+as when the creatures had pygame vectors """
+from math import sqrt, atan2, sin, cos, fmod, pi
+
+# pygame's default epsilon, used for the special rotations and zero lengths
+EPSILON = 1e-6
+
+
+def length(x, y):
+    return sqrt(x * x + y * y)
+
+
+def angle_of(x, y):
+    """ angle in degrees, as the second value of Vector2.as_polar() """
+    return atan2(y, x) * 180. / pi
+
+
+def scaled_to(x, y, new_length):
+    """ x, y with the given length (Vector2.scale_to_length) """
+    old_length = sqrt(x * x + y * y)
+    if old_length < EPSILON:
+        raise ValueError("Cannot scale a vector with zero length")
+    fraction = new_length / old_length
+    return x * fraction, y * fraction
+
+
+def clamped(x, y, max_length):
+    """ x, y scaled down to max_length if longer """
+    if sqrt(x * x + y * y) > max_length:
+        return scaled_to(x, y, max_length)
+    return x, y
+
+
+def rotated(x, y, angle):
+    """ x, y rotated angle degrees (Vector2.rotate) """
+    angle = fmod(angle * pi / 180., 2 * pi)
+    if angle < 0:
+        angle += 2 * pi
+    # multiples of 90 degrees are exact
+    if fmod(angle + EPSILON, pi / 2) < 2 * EPSILON:
+        quarter = int((angle + EPSILON) / (pi / 2))
+        if quarter in (0, 4):
+            return x, y
+        if quarter == 1:
+            return -y, x
+        if quarter == 2:
+            return -x, -y
+        return y, -x
+    sin_value = sin(angle)
+    cos_value = cos(angle)
+    return cos_value * x - sin_value * y, sin_value * x + cos_value * y
@@ -0,0 +1,457 @@
+from math import sqrt
+import numpy as np
+
+from settings import *
+from datastats import creature_info
+from eventlog import RECORD
+from creature import Creature
+from world import World
+from spatial import PointGrid
+
+
+class Columns:
+    """ structure of arrays: one contiguous numpy array per field,
+    amortized growth and O(1) swap removal. Every row has an owner
+    object which knows its row index as owner.slot. Swap removal changes
+    the order of the rows, the "added" field keeps the order they were
+    appended in """
+
+    def __init__(self, spec, capacity=64):
+        # spec maps a field name to its width (1 for scalars) and dtype
+        self.spec = spec
+        self.n = 0
+        self.capacity = capacity
+        self.arrays = {}
+        for name, (width, dtype) in spec.items():
+            shape = (capacity,) if width == 1 else (capacity, width)
+            self.arrays[name] = np.zeros(shape, dtype=dtype)
+        self.arrays["added"] = np.zeros(capacity, dtype=np.int64)
+        self.appended = 0
+        self.owners = []
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, name):
+        """ view of the used rows of a field """
+        return self.arrays[name][:self.n]
+
+    def append(self, owner, values):
+        if self.n == self.capacity:
+            self.capacity *= 2
+            for name, arr in self.arrays.items():
+                grown = np.zeros((self.capacity,) + arr.shape[1:], dtype=arr.dtype)
+                grown[:self.n] = arr[:self.n]
+                self.arrays[name] = grown
+        slot = self.n
+        for name, value in values.items():
+            self.arrays[name][slot] = value
+        self.arrays["added"][slot] = self.appended
+        self.appended += 1
+        self.owners.append(owner)
+        owner.slot = slot
+        self.n += 1
+
+    def remove(self, owner):
+        """ moves the last row into the removed one """
+        slot = owner.slot
+        last = self.n - 1
+        if slot != last:
+            for arr in self.arrays.values():
+                arr[slot] = arr[last]
+            moved = self.owners[last]
+            self.owners[slot] = moved
+            moved.slot = slot
+        self.owners.pop()
+        self.n -= 1
+        owner.slot = None
+
+    def reorder(self, owners):
+        """ puts the rows in the order of owners (the same objects) """
+        rows = [owner.slot for owner in owners]
+        for name, arr in self.arrays.items():
+            arr[:self.n] = arr[rows]
+        self.owners = list(owners)
+        for slot, owner in enumerate(self.owners):
+            owner.slot = slot
+
+
+CREATURE_FIELDS = {
+    # state, updated every step
+    'pos': (2, np.float64),
+    'vel': (2, np.float64),
+    'desired': (2, np.float64),
+    'wander_ring_pos': (2, np.float64),
+    'health': (1, np.float64),
+    'age': (1, np.float64),
+    'food_eaten': (1, np.int64),
+    'poison_eaten': (1, np.int64),
+    'last_wr_time': (1, np.int64),
+    # decoded dna, constant for the life of the creature
+    'radius': (1, np.float64),
+    'max_vel': (1, np.float64),
+    'max_steer_force': (1, np.float64),
+    'food_attraction': (1, np.float64),
+    'poison_attraction': (1, np.float64),
+    'food_dist': (1, np.float64),
+    'poison_dist': (1, np.float64),
+    'dir_angle_mult': (1, np.float64),
+}
+# fields that live in the arrays while the creature is in a VecWorld
+STATE_FIELDS = ('pos', 'vel', 'desired', 'wander_ring_pos', 'health', 'age',
+                'food_eaten', 'poison_eaten', 'last_wr_time')
+# attributes of the creature stored in them: (field, column of the vectors)
+STATE_ATTRIBUTES = {
+    'x': ('pos', 0), 'y': ('pos', 1),
+    'vel_x': ('vel', 0), 'vel_y': ('vel', 1),
+    'desired_x': ('desired', 0), 'desired_y': ('desired', 1),
+    'wander_x': ('wander_ring_pos', 0), 'wander_y': ('wander_ring_pos', 1),
+    'health': ('health', None), 'age': ('age', None),
+    'food_eaten': ('food_eaten', None), 'poison_eaten': ('poison_eaten', None),
+    'last_wr_time': ('last_wr_time', None),
+}
+
+FOOD_FIELDS = {
+    'pos': (2, np.float64),
+    'radius': (1, np.float64),
+    'is_poison': (1, np.bool_),
+}
+
+
+def _state_property(name):
+    """ attribute stored in the world arrays while the creature is attached,
+    in its own slot of Creature otherwise (before spawn and after death) """
+    own = Creature.__dict__[name]  # the slot descriptor
+    field, column = STATE_ATTRIBUTES[name]
+
+    def fget(self):
+        if self.slot is None:
+            return own.__get__(self)
+        if column is None:
+            return self.columns.arrays[field].item(self.slot)
+        return self.columns.arrays[field].item(self.slot, column)
+
+    def fset(self, value):
+        if self.slot is None:
+            own.__set__(self, value)
+        elif column is None:
+            self.columns.arrays[field][self.slot] = value
+        else:
+            self.columns.arrays[field][self.slot, column] = value
+
+    return property(fget, fset)
+
+
+class VecCreature(Creature):
+    """ a Creature whose state is a row of VecWorld arrays, it keeps the
+    same attributes and methods so the rest of the code can't tell """
+
+    __slots__ = ("slot", "columns")
+
+    x = _state_property('x')
+    y = _state_property('y')
+    vel_x = _state_property('vel_x')
+    vel_y = _state_property('vel_y')
+    desired_x = _state_property('desired_x')
+    desired_y = _state_property('desired_y')
+    wander_x = _state_property('wander_x')
+    wander_y = _state_property('wander_y')
+    health = _state_property('health')
+    age = _state_property('age')
+    food_eaten = _state_property('food_eaten')
+    poison_eaten = _state_property('poison_eaten')
+    last_wr_time = _state_property('last_wr_time')
+
+    def __init__(self, *args, **kwargs):
+        self.slot = None
+        self.columns = None
+        super().__init__(*args, **kwargs)
+
+    def fitness(self):
+        # the state changes in the arrays, the batched code computes the
+        # fitness of every creature at once (VecWorld.fitness)
+        return sqrt(max(self.age + (self.food_eaten * 2) - self.poison_eaten, 0))
+
+    def update_fitness(self):
+        pass
+
+    def attach(self, columns):
+        if self.wander_at_pos:
+            # the batched wander keeps its own copy of the ring center
+            self.wander_x, self.wander_y = self.x, self.y
+            self.wander_at_pos = False
+        values = {name: getattr(self, name) for name in CREATURE_FIELDS
+                  if name not in STATE_FIELDS}
+        for name, (field, column) in STATE_ATTRIBUTES.items():
+            if column is None:
+                values[field] = getattr(self, name)
+            else:
+                values.setdefault(field, [0.0, 0.0])[column] = getattr(self, name)
+        self.columns = columns
+        columns.append(self, values)
+
+    def detach(self):
+        # copy the last values back to the object, dead creatures are
+        # still used by the stats and the By Gen breeding
+        values = {name: getattr(self, name) for name in STATE_ATTRIBUTES}
+        self.columns.remove(self)
+        for name, value in values.items():
+            setattr(self, name, value)
+
+
+def _clamp_length(x, y, max_len):
+    """ scale_to_length for the rows longer than max_len """
+    length = np.hypot(x, y)
+    over = length > max_len
+    scale = np.ones_like(length)
+    np.divide(max_len, length, out=scale, where=over)
+    return x * scale, y * scale
+
+
+class VecWorld(World):
+    """ World backend that keeps creatures and foods in contiguous numpy
+    arrays and steers the whole population in one batched pass, with the
+    same rules as Creature.seek_targets, seek and update """
+
+    creature_class = VecCreature
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.creatures = Columns(CREATURE_FIELDS)
+        self.foods = Columns(FOOD_FIELDS, capacity=max(64, TOTAL_FOOD + TOTAL_POISON))
+        # grids are rebuilt lazily, foods when they change, creatures
+        # every step as all of them move
+        self._food_grid = None
+        self._creature_grid = None
+
+    def food_grid(self):
+        if self._food_grid is None:
+            self._food_grid = PointGrid(self.foods['pos'], SPATIAL_CELL_SIZE)
+        return self._food_grid
+
+    def creature_grid(self):
+        if self._creature_grid is None:
+            self._creature_grid = PointGrid(self.creatures['pos'], SPATIAL_CELL_SIZE)
+        return self._creature_grid
+
+    def add_creature(self, creature):
+        # positions live in the arrays, creature_index is not used
+        self.all_creatures.add(creature)
+        creature.attach(self.creatures)
+        self._creature_grid = None
+
+    def remove_creature(self, creature):
+        creature.detach()
+        self.all_creatures.remove(creature)
+        self._creature_grid = None
+
+    def add_food(self, food):
+        super().add_food(food)
+        self.foods.append(food, {'pos': (food.x, food.y),
+                                 'radius': food.radius,
+                                 'is_poison': food.is_poison})
+        self._food_grid = None
+
+    def remove_food(self, food):
+        super().remove_food(food)
+        self.foods.remove(food)
+        self._food_grid = None
+
+    def restore_order(self, creatures, foods):
+        """ order of the rows in the arrays, the batched passes depend on
+        it (see checkpoint.py) """
+        self.creatures.reorder(creatures)
+        self.foods.reorder(foods)
+        self._creature_grid = None
+        self._food_grid = None
+
+    def valid_food_pos(self, newpos):
+        return not (self.food_index.any_within(newpos, DISTANCE_BETWEEN_SPRITES) or
+                    self.creature_grid().any_within(newpos, DISTANCE_BETWEEN_SPRITES))
+
+    def blocked_for_creatures(self, points):
+        blocked = np.zeros(len(points), dtype=bool)
+        q, p, _, _, dist = self.food_grid().pairs(points, DISTANCE_BETWEEN_SPRITES)
+        blocked[q[(dist < DISTANCE_BETWEEN_SPRITES) & self.foods['is_poison'][p]]] = True
+        return blocked
+
+    def blocked_for_foods(self, points):
+        blocked = np.zeros(len(points), dtype=bool)
+        for grid in (self.food_grid(), self.creature_grid()):
+            q, _, _, _, dist = grid.pairs(points, DISTANCE_BETWEEN_SPRITES)
+            blocked[q[dist < DISTANCE_BETWEEN_SPRITES]] = True
+        return blocked
+
+    def dead_creatures(self):
+        owners = self.creatures.owners
+        return [owners[i] for i in np.flatnonzero(self.creatures['health'] <= 0)]
+
+    def fitness(self):
+        """ fitness of every alive creature, in row order """
+        c_arr = self.creatures
+        return np.sqrt(np.maximum(
+            c_arr['age'] + c_arr['food_eaten'] * 2 - c_arr['poison_eaten'], 0))
+
+    def top(self, k):
+        fitness = self.fitness()
+        if len(fitness) > k:
+            rows = np.argpartition(-fitness, k)[:k]
+        else:
+            rows = np.arange(len(fitness))
+        # fittest first
+        rows = rows[np.argsort(-fitness[rows], kind="stable")]
+        return [self.creatures.owners[i] for i in rows]
+
+    def check_record(self):
+        c_arr = self.creatures
+        if not len(c_arr):
+            return
+        fitness = self.fitness()
+        best = int(np.argmax(fitness))
+        c = c_arr.owners[best]
+        # record of all times:
+        if fitness[best] > self.ds.fitness_record:
+            self.ds.oldest_age = c.age
+            self.ds.fitness_record = c.fitness()
+            if (self.ds.fittest is not None and c is not self.ds.fittest and
+                    self.log.enabled[RECORD]):
+                self.log.add(RECORD, creature_info(self.ds.fittest), creature_info(c))
+            self.ds.fittest = c
+        # current age record creature:
+        if fitness[best] > 0:
+            self.ds.current_fittest = c
+
+    def steer_targets(self):
+        """ batched seek_targets: returns the steer force of every creature
+        and a mask of the ones that have no target in range """
+        c, f = self.creatures, self.foods
+        n = len(c)
+        steer = np.zeros((n, 2))
+        no_target = np.ones(n, dtype=bool)
+        if not len(f):
+            return steer, no_target
+
+        pos, vel = c['pos'], c['vel']
+        # every creature/target pair in perception range
+        ci, fj, dx, dy, dist = self.food_grid().pairs(
+            pos, np.maximum(c['food_dist'], c['poison_dist']))
+        poison = f['is_poison'][fj]
+        in_range = dist <= np.where(poison, c['poison_dist'][ci], c['food_dist'][ci])
+        ci, dx, dy, dist, poison = (ci[in_range], dx[in_range], dy[in_range],
+                                    dist[in_range], poison[in_range])
+        if not len(ci):
+            return steer, no_target
+        min_dist = np.full(n, np.inf)
+        np.minimum.at(min_dist, ci, dist)
+        any_in = np.isfinite(min_dist)
+        no_target[any_in] = False
+
+        # desired vector to every target scaled to our max_vel
+        max_vel = c['max_vel']
+        scale = np.ones_like(dist)
+        np.divide(max_vel[ci], dist, out=scale, where=dist > 0.001)
+        # angle difference between the target and our velocity,
+        # targets in front of us have priority, as_polar() gives degrees
+        vel_angle = np.degrees(np.arctan2(vel[:, 1], vel[:, 0]))
+        angle_diff = np.abs(vel_angle[ci] - np.degrees(np.arctan2(dy, dx)))
+        mult = np.where(dist == min_dist[ci], 2, 1)
+        attraction = np.where(poison, c['poison_attraction'][ci],
+                              c['food_attraction'][ci])
+        weight = scale * attraction * mult / (
+            1 + dist + np.sqrt(angle_diff * c['dir_angle_mult'][ci]))
+
+        # sum all the force, in case it is too low multiply by max_vel
+        des_x = np.bincount(ci, weights=dx * weight, minlength=n) * max_vel
+        des_y = np.bincount(ci, weights=dy * weight, minlength=n) * max_vel
+        des_x, des_y = _clamp_length(des_x, des_y, max_vel)
+
+        c['desired'][any_in, 0] = des_x[any_in]
+        c['desired'][any_in, 1] = des_y[any_in]
+        sx, sy = _clamp_length(des_x - vel[:, 0], des_y - vel[:, 1], c['max_steer_force'])
+        steer[any_in, 0] = sx[any_in]
+        steer[any_in, 1] = sy[any_in]
+        return steer, no_target
+
+    def steer_wander(self, rows):
+        """ batched wander_by_ring + seek for the given creature rows """
+        c = self.creatures
+        pos, vel = c['pos'][rows], c['vel'][rows]
+        ring = c['wander_ring_pos']
+        last_wr_time = c['last_wr_time']
+
+        renew = rows[self.ticks - last_wr_time[rows] > WANDER_RING_WAIT]
+        if len(renew):
+            last_wr_time[renew] = self.ticks
+            new_pos = np.column_stack((
+                self.np_rng.integers(0, int(WORLD_WIDTH), len(renew), endpoint=True),
+                self.np_rng.integers(0, int(WORLD_HEIGHT), len(renew), endpoint=True),
+            )).astype(np.float64)
+            r_vel = c['vel'][renew]
+            speed = np.hypot(r_vel[:, 0], r_vel[:, 1])
+            moving = speed > 0
+            ahead = new_pos * WANDER_RING_DISTANCE
+            ahead[moving] = new_pos[moving] + \
+                r_vel[moving] / speed[moving, None] * WANDER_RING_DISTANCE
+            ring[renew] = ahead
+
+        angle = np.radians(self.np_rng.uniform(0, 360, len(rows)))
+        target_x = ring[rows, 0] + WANDER_RING_RADIUS * np.cos(angle)
+        target_y = ring[rows, 1] + WANDER_RING_RADIUS * np.sin(angle)
+
+        # seek
+        max_vel = c['max_vel'][rows]
+        des_x, des_y = target_x - pos[:, 0], target_y - pos[:, 1]
+        length = np.hypot(des_x, des_y)
+        scale = np.ones_like(length)
+        np.divide(max_vel, length, out=scale, where=length > 0.001)
+        des_x, des_y = des_x * scale, des_y * scale
+        c['desired'][rows, 0] = des_x
+        c['desired'][rows, 1] = des_y
+        return _clamp_length(des_x - vel[:, 0], des_y - vel[:, 1],
+                             c['max_steer_force'][rows])
+
+    def update_creatures(self, dt):
+        c = self.creatures
+        if not len(c):
+            return
+        acc, no_target = self.steer_targets()
+        rows = np.flatnonzero(no_target)
+        if len(rows):
+            acc[rows, 0], acc[rows, 1] = self.steer_wander(rows)
+
+        vel = c['vel']
+        vel += acc
+        vx, vy = _clamp_length(vel[:, 0], vel[:, 1], c['max_vel'])
+        vel[:, 0], vel[:, 1] = vx, vy
+
+        c['pos'][:] += vel * dt
+        c['health'][:] -= HEALTH_DEGENERATION * dt
+        c['age'][:] += dt
+        self._creature_grid = None
+
+    def process_collisions(self):
+        """ a food is eaten by the first creature whose circle overlaps or
+        touches it, compared as World does """
+        c, f = self.creatures, self.foods
+        if not len(c) or not len(f):
+            return
+        ci, fj, dx, dy, _ = self.food_grid().pairs(
+            c['pos'], c['radius'] + self.max_food_radius)
+        # squared, so a touching pair is the same in both engines
+        reach = c['radius'][ci] + f['radius'][fj]
+        overlap = dx * dx + dy * dy <= reach * reach
+        ci, fj = ci[overlap], fj[overlap]
+        if not len(ci):
+            return
+        # first creature for each food, in the order they were added to
+        # the world like World (not by row, removals move the rows)
+        order = np.lexsort((c['added'][ci], fj))
+        ci, fj = ci[order], fj[order]
+        first = np.ones(len(fj), dtype=bool)
+        first[1:] = fj[1:] != fj[:-1]
+
+        creatures = [c.owners[i] for i in ci[first]]
+        foods = [f.owners[j] for j in fj[first]]
+        for creature, food in zip(creatures, foods):
+            creature.eat(food.is_poison)
+            self.remove_food(food)
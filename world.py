@@ -0,0 +1,534 @@
+import argparse
+import random
+from time import perf_counter
+import numpy as np
+
+from settings import *
+from groups import Group
+from datastats import Datastats, creature_info
+from creature import Creature, Food
+from spatial import SpatialHash
+from profiler import PhaseProfiler
+from leaderboard import Leaderboard
+from selection import breed, mutation_ranges
+from spawner import free_positions
+from eventlog import EventLog, LEVELS, MUTATION, BIRTH, DEATH, GENERATION, RECORD
+
+
+class World:
+    """ the simulation itself: creatures, foods, spawning, collisions and
+    statistics. It knows nothing about the display, time only advances
+    when step() is called with a dt in seconds """
+
+    # class used to instantiate creatures, backends may use a subclass
+    creature_class = Creature
+
+    def __init__(self, spawn_mode=None, save_to_csv=None, seed=None):
+        # SPAWN_MODE and SAVE_TO_CSV by default
+        if spawn_mode is None:
+            spawn_mode = SPAWN_MODE
+        if save_to_csv is None:
+            save_to_csv = SAVE_TO_CSV
+        self.spawn_mode = spawn_mode  # False: Continuous, True: ByGen
+        self.save_to_csv = save_to_csv
+
+        # every random decision of the world and its creatures comes from
+        # here, the same seed (and dts and toggles) gives the same run
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # numpy generator for the batched work, seeded by the same seed
+        self.np_rng = np.random.default_rng(seed)
+        # a replay.Recording, if the run is being recorded
+        self.recording = None
+        # a metrics.MetricsServer, if the run is being watched
+        self.metrics = None
+
+        # simulated time in milliseconds, replaces pygame.time.get_ticks()
+        self.ticks = 0
+        self.steps = 0
+        # simulated seconds, the sum of the dts the creatures have aged
+        self.clock = 0.0
+        # highest generation born so far
+        self.generation = 0
+        # dna received from other worlds (see islands.py), spawned as soon
+        # as there is room (Continuous) or with the next generation (By Gen)
+        self.immigrants = []
+
+        # prefix of the files saved by this run (see run_prefix)
+        self.prefix = run_prefix()
+        # for storing data and statistics about the game
+        self.ds = Datastats(prefix=self.prefix)
+        # mutations, births, deaths, generations and records
+        self.log = EventLog()
+        # times the phases of step(), does nothing until enabled
+        self.profiler = PhaseProfiler()
+
+        # see checkpoint.py, checkpoint_delay in simulated milliseconds (0: never)
+        self.checkpoint_path = self.prefix + "_checkpoint.ckpt"
+        self.checkpoint_delay = CHECKPOINT_DELAY
+        self.last_checkpoint = 0
+
+        # the alive creatures and the foods (and poisons)
+        self.all_creatures = Group()
+        self.all_foods = Group()
+
+        # spatial indexes, so nothing has to scan every entity
+        self.food_index = SpatialHash(SPATIAL_CELL_SIZE)  # food and poison
+        self.poison_index = SpatialHash(SPATIAL_CELL_SIZE)  # also counts the poisons
+        self.creature_index = SpatialHash(SPATIAL_CELL_SIZE)
+        self.max_food_radius = 0
+
+        # alive creatures sorted by fitness, updated when they change
+        self.leaderboard = Leaderboard()
+
+    def new_creature(self, pos, dna=None):
+        return self.creature_class(pos, dna, self.rng, self.log)
+
+    def add_creature(self, creature):
+        self.all_creatures.add(creature)
+        self.creature_index.insert(creature)
+        self.leaderboard.add(creature, self.clock)
+
+    def add_food(self, food):
+        self.all_foods.add(food)
+        if food.is_poison:
+            self.poison_index.insert(food)
+        self.food_index.insert(food)
+        self.max_food_radius = max(self.max_food_radius, food.radius)
+
+    def remove_creature(self, creature):
+        self.creature_index.remove(creature)
+        self.leaderboard.remove(creature)
+        self.all_creatures.remove(creature)
+
+    def remove_food(self, food):
+        self.food_index.remove(food)
+        self.poison_index.remove(food)
+        self.all_foods.remove(food)
+
+    def food_counts(self):
+        """ number of foods and of poisons """
+        poisons = len(self.poison_index)
+        return len(self.all_foods) - poisons, poisons
+
+    def valid_creature_pos(self, newpos):
+        """ creatures can't spawn next to poison """
+        return not self.poison_index.any_within(newpos, DISTANCE_BETWEEN_SPRITES)
+
+    def valid_food_pos(self, newpos):
+        """ food and poison can't spawn next to anything """
+        return not (self.food_index.any_within(newpos, DISTANCE_BETWEEN_SPRITES) or
+                    self.creature_index.any_within(newpos, DISTANCE_BETWEEN_SPRITES))
+
+    def toggle_spawn_mode(self):
+        if self.recording is not None:
+            self.recording.add_event(self.steps, "toggle_spawn_mode")
+        self.spawn_mode = not self.spawn_mode
+        if self.spawn_mode:
+            # if mode is now ByGen, clear dict
+            self.ds.temp_hist_by_gen.clear()
+
+    def toggle_save(self):
+        if self.recording is not None:
+            self.recording.add_event(self.steps, "toggle_save")
+        self.save_to_csv = not self.save_to_csv
+
+    def blocked_for_creatures(self, points):
+        """ mask of the points (rows x, y) where a creature can't spawn """
+        return np.array([not self.valid_creature_pos(p) for p in points.tolist()], dtype=bool)
+
+    def blocked_for_foods(self, points):
+        """ mask of the points (rows x, y) where a food can't spawn """
+        return np.array([not self.valid_food_pos(p) for p in points.tolist()], dtype=bool)
+
+    def creature_positions(self, count):
+        """ up to count free positions for new creatures (see spawner.py) """
+        return free_positions(count, self.blocked_for_creatures, self.np_rng,
+                              DISTANCE_BETWEEN_SPRITES).tolist()
+
+    def food_positions(self, count):
+        """ up to count free positions for new foods and poisons """
+        return free_positions(count, self.blocked_for_foods, self.np_rng,
+                              DISTANCE_BETWEEN_SPRITES).tolist()
+
+    def spawn_random_creatures(self, count):
+        """ spawns up to count new random creatures, returns how many """
+        positions = self.creature_positions(min(count, TOTAL_CREATURES - len(self.all_creatures)))
+        for newpos in positions:
+            self.add_creature(self.new_creature(newpos))
+        return len(positions)
+
+    def spawn_immigrants(self):
+        """ spawns creatures with the dna in self.immigrants while there is room """
+        count = min(len(self.immigrants), TOTAL_CREATURES - len(self.all_creatures))
+        if count <= 0:
+            return
+        for newpos in self.creature_positions(count):
+            self.add_creature(self.new_creature(newpos, self.immigrants.pop(0)))
+
+    def top(self, k):
+        """ the k fittest alive creatures, fittest first """
+        return self.leaderboard.top(k, self.clock)
+
+    def check_record(self):
+        # check for the current record and global record of creature age,
+        # only the fittest alive creature can beat them
+        c = self.leaderboard.best(self.clock)
+        if c is None:
+            return
+        fitness = c.fitness()
+        # record of all times:
+        if fitness > self.ds.fitness_record:
+            self.ds.oldest_age = c.age
+            self.ds.fitness_record = fitness
+            if (self.ds.fittest is not None and c is not self.ds.fittest and
+                    self.log.enabled[RECORD]):
+                self.log.add(RECORD, creature_info(self.ds.fittest), creature_info(c))
+            self.ds.fittest = c
+
+        # current age record creature:
+        if fitness > 0:
+            self.ds.current_fittest = c
+
+    def spawn_creatures_continuous(self):
+        # spawn a new creature or try to breed existing one
+        # we always try to spawn a full set of creatures if there are 0
+        self.spawn_immigrants()
+
+        loops = 1
+        if not self.all_creatures:
+            loops = TOTAL_CREATURES
+
+        if self.rng.random() < NEW_CREATURE_CHANCE or not self.all_creatures:
+            if len(self.all_creatures) < TOTAL_CREATURES:
+                self.spawn_random_creatures(loops)
+        else:
+            # we can breed if all_creatures is not empty and we still have room
+            if len(self.all_creatures) < TOTAL_CREATURES and self.all_creatures:
+                # we pick one random creature as a parent and try to breed it
+                parent = self.rng.choice(list(self.all_creatures))
+                dna = parent.breed()
+                if dna is not None:
+                    # breed was successful, look for a free position to spawn
+                    for newpos in self.creature_positions(1):
+                        # got a valid position, create a new creature there with dna as heritage
+                        child = self.new_creature(newpos, dna)
+                        self.add_creature(child)
+                        parent.childs += 1  # the parent, augments its childs counter
+                        child.gen += 1 + parent.gen  # update the childs gen by 1 + parents gen
+                        self.generation = max(self.generation, child.gen)
+                        if self.log.enabled[BIRTH]:
+                            self.log.add(BIRTH, id(child), id(parent), child.gen, None)
+
+    def spawn_creatures_by_gen(self):
+        """ spawn a new generation when all creatures die """
+        if not self.all_creatures:
+            # only spawn when there are 0 creatures alive
+            if self.ds.temp_hist_by_gen:
+                # we have an old generation, spawn a new one
+                # using dna from old gen, fittest ones have
+                # greater chance to spawn childs
+
+                # fistly, calculate the chance to breed of each creature
+                # according to its fitness and the fitness of others
+                self.ds.calc_fitness_by_gen()
+                info = self.rng.choice(list(self.ds.temp_hist_by_gen.keys()))
+
+                # here we try to spawn one new creature to add variation
+                # this disrupts generation counter as this creature will
+                # have gen = 0, but I don't like the idea of setting it
+                # to have the current gen as its unreal
+                chance = 1
+                if self.ds.means[0]:
+                    chance = min(4 / self.ds.means[0], 0.9)
+                if self.rng.random() < chance:
+                    self.spawn_random_creatures(1)
+
+                if self.log.enabled[GENERATION]:
+                    self.log.add(GENERATION, info.gen + 1, len(self.ds.temp_hist_by_gen))
+                # migrants from other worlds join the new generation
+                self.spawn_immigrants()
+                # now we breed the rest of the generation by that chance
+                self.spawn_generation(list(self.ds.temp_hist_by_gen))
+                # append to hist old generation
+                for creature, _ in self.ds.temp_hist_by_gen.items():
+                    self.ds.append_to_hist(creature, self.ticks)
+                    del creature
+                # clear old generation
+                self.ds.temp_hist_by_gen.clear()
+            else:
+                # we don't have data from old gen, spawn new creatures
+                self.spawn_random_creatures(TOTAL_CREATURES)
+
+    def spawn_generation(self, parents):
+        """ breeds the old generation (parents) until max population, all
+        the children at once (see selection.py). Children without a free
+        position are dropped and bred again, until the generation is full
+        or there is no free position left """
+        if not parents:
+            return
+        fitness = np.array([c.fitness() for c in parents])
+        dna = np.array([c.dna for c in parents], dtype=float)
+        count = TOTAL_CREATURES - len(self.all_creatures)
+        while count > 0:
+            rows, children, mask = breed(dna, fitness, count, self.np_rng)
+            positions = self.creature_positions(count)
+            if not positions:
+                # the world is full, the generation stays short
+                break
+            placed = len(positions)
+
+            # only the children that are born
+            if self.log.enabled[MUTATION]:
+                ranges = mutation_ranges(fitness[rows])
+                for i, j in zip(*np.nonzero(mask[:placed])):
+                    old = dna[rows[i], j]
+                    self.log.add(MUTATION, id(parents[rows[i]]), int(j), ranges[i],
+                                 children[i, j] - old, old, children[i, j])
+
+            for i, newpos in enumerate(positions):
+                # create a new creature there with dna as heritage
+                parent = parents[rows[i]]
+                child = self.new_creature(newpos, children[i].tolist())
+                self.add_creature(child)
+                parent.childs += 1  # the parent, augments its childs counter
+                child.gen += 1 + parent.gen  # update the childs gen by 1 + parents gen
+                self.generation = max(self.generation, child.gen)
+                if self.log.enabled[BIRTH]:
+                    self.log.add(BIRTH, id(child), id(parent), child.gen,
+                                 self.ds.temp_hist_by_gen.get(parent))
+            count -= placed
+
+    def spawn_foods(self, limit=None):
+        """ adds up to limit (default SPAWN_FOOD_PER_STEP, 0: no limit)
+        poisons and foods, while there are less than TOTAL_POISON / TOTAL_FOOD """
+        limit = SPAWN_FOOD_PER_STEP if limit is None else limit
+        foods, poisons = self.food_counts()
+        poisons = max(0, TOTAL_POISON - poisons)
+        foods = max(0, TOTAL_FOOD - foods)
+        if limit:
+            poisons, foods = min(poisons, limit), min(foods, limit)
+        if not poisons and not foods:
+            return
+        # poison first, both in one go so they keep apart
+        positions = self.food_positions(poisons + foods)
+        for i, newpos in enumerate(positions):
+            self.add_food(Food(newpos, 5, i < poisons))
+
+    def update_creatures(self, dt):
+        for c in self.all_creatures:
+            # only the foods around can be in range
+            targets = self.food_index.nearby(c.x, c.y, max(c.food_dist, c.poison_dist))
+            c.update(dt, targets, self.ticks)
+            self.creature_index.move(c)
+
+    def dead_creatures(self):
+        return [c for c in self.all_creatures if c.is_dead()]
+
+    def process_collisions(self):
+        """ a food is eaten by the first creature whose circle overlaps or
+        touches it (as pygame's collide_circle did) """
+        for creature in self.all_creatures:
+            x, y = creature.x, creature.y
+            for food in self.food_index.nearby(x, y, creature.radius + self.max_food_radius):
+                dx = food.x - x
+                dy = food.y - y
+                reach = creature.radius + food.radius
+                if dx * dx + dy * dy <= reach * reach:
+                    creature.eat(food.is_poison)
+                    self.leaderboard.update(creature, self.clock)
+                    # kill and remove the food
+                    self.remove_food(food)
+
+    def step(self, dt=None):
+        """ advances the simulation dt seconds (default SIM_DT) """
+        if dt is None:
+            dt = SIM_DT
+        if self.recording is not None:
+            self.recording.add_step(dt)
+        self.ticks += round(dt * 1000)
+        self.steps += 1
+        self.log.ticks = self.ticks
+
+        profiler = self.profiler
+        # spawn creatures according to selected mode
+        if self.spawn_mode:
+            self.spawn_creatures_by_gen()
+        else:
+            self.spawn_creatures_continuous()
+        profiler.lap("spawn creatures")
+        # food/poison, we check everything not to spawn food on top of anything
+        self.spawn_foods()
+        profiler.lap("spawn foods")
+
+        self.update_creatures(dt)
+        self.clock += dt
+        profiler.lap("update creatures")
+        # check if any creature died
+        for creature in self.dead_creatures():
+            if self.log.enabled[DEATH]:
+                self.log.add(DEATH, id(creature), creature.age, creature.fitness())
+            if self.spawn_mode:
+                # if we are in ByGen mode, we will append to hist later
+                self.ds.temp_hist_by_gen[creature] = 0  # set fitness for By Gen mode
+            else:
+                # append to hist
+                self.ds.append_to_hist(creature, self.ticks)
+            # kill the poor creature
+            self.remove_creature(creature)
+            del creature
+        profiler.lap("deaths")
+
+        self.process_collisions()
+        profiler.lap("collisions")
+
+        self.check_record()
+        profiler.lap("check record")
+
+        # save csv and stats
+        if self.ticks - self.ds.last_save > SAVE_DELAY:
+            self.ds.last_save = self.ticks
+            self.flush_log()
+            self.ds.calc_stats(self.ticks)
+            if self.save_to_csv:
+                self.ds.save()
+        elif self.log.full():
+            self.flush_log()
+
+        if self.checkpoint_delay and self.ticks - self.last_checkpoint >= self.checkpoint_delay:
+            self.checkpoint()
+        if self.metrics is not None:
+            self.metrics.publish(self)
+        profiler.lap("stats and saves")
+
+    def flush_log(self):
+        """ writes the pending events, in the background writer if enabled """
+        events = self.log.take()
+        if not events:
+            return
+        if self.ds.background_writer:
+            self.ds.start_writer().submit(self.log.write, events, rows=len(events))
+        else:
+            self.log.write(events)
+
+    def checkpoint(self, path=None):
+        """ saves the state of the world to resume it later, the file is
+        written in the background """
+        from checkpoint import save_checkpoint
+        self.last_checkpoint = self.ticks
+        save_checkpoint(self, path or self.checkpoint_path)
+
+    def close(self):
+        """ saves the pending records and waits for the background writes """
+        if self.metrics is not None:
+            self.metrics.close()
+            self.metrics = None
+        self.flush_log()
+        if self.save_to_csv:
+            self.ds.save()
+        self.ds.close()
+
+    def run(self, steps=None, seconds=None, generations=None, dt=None):
+        """ steps the world as fast as possible, without frame cap, until
+        the step budget, the simulated seconds or the generations are consumed """
+        if dt is None:
+            dt = SIM_DT
+        end_ticks = None if seconds is None else self.ticks + seconds * 1000
+        done = 0
+        while steps is None or done < steps:
+            if end_ticks is not None and self.ticks >= end_ticks:
+                break
+            if generations is not None and self.generation >= generations:
+                break
+            self.step(dt)
+            # headless, every step is a frame
+            self.profiler.end_frame()
+            done += 1
+        return done
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the simulation headless, as fast as possible")
+    parser.add_argument("--steps", type=int, default=None,
+                        help="number of steps to simulate")
+    parser.add_argument("--seconds", type=float, default=None,
+                        help="simulated seconds to run")
+    parser.add_argument("--generations", type=int, default=None,
+                        help="stop when this generation is born")
+    parser.add_argument("--dt", type=float, default=SIM_DT,
+                        help="simulated seconds per step")
+    parser.add_argument("--by-gen", action="store_true",
+                        help="use By Gen spawn mode instead of Continuous")
+    parser.add_argument("--csv", action="store_true",
+                        help="save CSVs to \"<start time>_*.csv\" (see OUTPUT_PREFIX)")
+    parser.add_argument("--numpy", action="store_true",
+                        help="use the batched numpy backend (VecWorld)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the run (default: a random one, printed at the end)")
+    parser.add_argument("--record", default=None, metavar="PATH",
+                        help="save a record of the run for replay.py")
+    parser.add_argument("--checkpoint-every", type=float, default=None, metavar="SECONDS",
+                        help="checkpoint every SECONDS simulated seconds and at the end")
+    parser.add_argument("--resume", default=None, metavar="PATH",
+                        help="continue the run saved in a checkpoint, appending to its outputs")
+    parser.add_argument("--log-level", choices=list(LEVELS), default=EVENT_LOG_LEVEL,
+                        help="events shown: debug (mutations, deaths), info (births, " +
+                        "generations), record (new records) or off")
+    parser.add_argument("--profile", default=None, metavar="PATH",
+                        help="time the phases of every step, save them to PATH (.json or .csv)")
+    parser.add_argument("--metrics", type=int, default=None, metavar="PORT",
+                        help="serve live metrics on http://METRICS_HOST:PORT/metrics " +
+                        "(Prometheus) and /metrics.json")
+    args = parser.parse_args()
+    if args.steps is None and args.seconds is None and args.generations is None:
+        parser.error("give a budget with --steps, --seconds and/or --generations")
+    if args.record and args.resume:
+        parser.error("--record can't be used with --resume, a record starts with the run")
+
+    if args.resume:
+        # backend, mode and seed come from the checkpoint
+        from checkpoint import load_checkpoint
+        world = load_checkpoint(args.resume)
+        print(f"Resumed {args.resume} at {world.ticks / 1000:.1f} simulated seconds")
+    else:
+        world_class = World
+        if args.numpy:
+            from vecworld import VecWorld
+            world_class = VecWorld
+        world = world_class(spawn_mode=args.by_gen, save_to_csv=args.csv or SAVE_TO_CSV,
+                            seed=args.seed)
+    if args.checkpoint_every:
+        world.checkpoint_delay = args.checkpoint_every * 1000
+    world.log.set_level(args.log_level)
+    if args.profile:
+        world.profiler.toggle()
+    if args.record:
+        from replay import start_recording
+        start_recording(world)
+    if args.metrics is not None:
+        from metrics import start_metrics
+        server = start_metrics(world, args.metrics)
+        print(f"Metrics on http://{server.host}:{server.port}/metrics")
+    start = perf_counter()
+    done = world.run(steps=args.steps, seconds=args.seconds,
+                     generations=args.generations, dt=args.dt)
+    elapsed = perf_counter() - start
+    if args.checkpoint_every or args.resume:
+        world.checkpoint()
+    world.close()
+    if args.record:
+        world.recording.save(args.record, world)
+
+    print(f"\n{done} steps ({world.ticks / 1000:.1f} simulated seconds) " +
+          f"in {elapsed:.2f} seconds ({done / max(elapsed, 1e-9):.1f} steps/s), seed {world.seed}")
+    world.ds.print_stats()
+    if args.profile:
+        print("\n" + "\n".join(world.profiler.lines()))
+        world.profiler.dump(args.profile)
+
+
+if __name__ == "__main__":
+    main()
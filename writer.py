@@ -0,0 +1,94 @@
+import queue
+import threading
+from time import perf_counter
+
+
+class BackgroundWriter(threading.Thread):
+    """ runs file writes (and console output) in its own thread. The
+    simulation submits jobs to a bounded queue, when the queue is full
+    submit() blocks until the writer catches up (backpressure) """
+
+    def __init__(self, maxsize=8):
+        super().__init__(name="BackgroundWriter", daemon=True)
+        self.jobs = queue.Queue(maxsize)
+
+        # counters
+        self.submitted = 0
+        self.written = 0
+        self.rows = 0
+        self.blocked = 0  # submits that had to wait for a free slot
+        self.max_depth = 0
+        self.last_latency = 0  # seconds spent running the last job
+        self.max_latency = 0
+        self.total_latency = 0
+        self.errors = 0
+
+        self.start()
+
+    @property
+    def depth(self):
+        return self.jobs.qsize()
+
+    def submit(self, func, *args, rows=0):
+        """ queues func(*args), rows only feeds the counters """
+        job = (func, args, rows)
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            self.blocked += 1
+            self.jobs.put(job)
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, self.jobs.qsize())
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                break
+            func, args, rows = job
+            start = perf_counter()
+            try:
+                func(*args)
+            except Exception as e:
+                # keep writing the next batches
+                self.errors += 1
+                print(f"BackgroundWriter: {func.__name__} failed: {e!r}")
+            latency = perf_counter() - start
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+            self.total_latency += latency
+            self.written += 1
+            self.rows += rows
+            self.jobs.task_done()
+
+    def flush(self):
+        """ waits until every submitted job is done """
+        self.jobs.join()
+
+    def close(self):
+        """ flushes and stops the thread """
+        if self.is_alive():
+            self.jobs.put(None)
+            self.join()
+
+    def counters(self):
+        mean_latency = self.total_latency / self.written if self.written else 0
+        return {
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_depth,
+            "submitted": self.submitted,
+            "written": self.written,
+            "rows": self.rows,
+            "blocked": self.blocked,
+            "errors": self.errors,
+            "last_latency_ms": self.last_latency * 1000,
+            "mean_latency_ms": mean_latency * 1000,
+            "max_latency_ms": self.max_latency * 1000,
+        }
+
+    def print_counters(self):
+        print("~~~~~~~~~~ writer ~~~~~~~~~~")
+        for name, value in self.counters().items():
+            print(f"{name}:\t{value}")
+        print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~")